@@ -1,28 +1,124 @@
-from flask import Blueprint, current_app, render_template, request, redirect, url_for, flash
+from flask import Blueprint, Response, abort, current_app, render_template, request, redirect, stream_with_context, url_for, flash
 from email_utils import send_email
-from models import Sticker, Order, Category, CustomSticker
+from models import Sticker, Order, OrderItem, Category, CustomSticker, ArchivedOrder, ArchivedOrderItem
 from utils import admin_required
+from search import index_sticker
+from pagination import paginate, paginate_union
+from catalog_cache import bump_catalog_version
+from uploads import enqueue_upload, duplicate_requests
+from catalog_import import import_stickers
+from exports import export_order_lines, EXPORT_FORMATS
+from analytics import record_order_change, dashboard
+from inventory import adjust_stock, on_hand_stock
 from werkzeug.utils import secure_filename
 from flask_mail import Message
 from utils import allowed_file, UPLOAD_FOLDER
 from decimal import Decimal
+from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload, selectinload
 from models import User
 from extensions import db, mail
-import cloudinary
-import cloudinary.uploader
 import os
 
 admin = Blueprint('admin', __name__, static_folder="static", template_folder="templates")
 
 
+ORDER_STATUSES = ["pending", "confirmed", "finished", "cancelled"]
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d") if value else None
+    except ValueError:
+        return None
+
+
+def _order_filters(model=Order):
+    # Status / date range filters from the query string, shared by the orders list
+    # and the export. Returns (conditions on model, filters to carry over into links).
+    status = request.args.get('status', '')
+    date_from = _parse_date(request.args.get('from'))
+    date_to = _parse_date(request.args.get('to'))
+
+    # A single status uses the (status, created_at) index for filtering and ordering
+    if status in ORDER_STATUSES:
+        conditions = [model.status == status]
+    else:
+        status = ''
+        conditions = [model.status != "cart"]
+    if date_from:
+        conditions.append(model.created_at >= date_from)
+    if date_to:
+        conditions.append(model.created_at < date_to + timedelta(days=1))
+
+    filters = {
+        'status': status or None,
+        'from': date_from.strftime("%Y-%m-%d") if date_from else None,
+        'to': date_to.strftime("%Y-%m-%d") if date_to else None,
+        # Old finished/cancelled orders live in the archive tables, only read when asked
+        'archived': '1' if request.args.get('archived') else None,
+    }
+    return conditions, filters
+
+
 @admin.route('/admin_orders')
 @admin_required
 def admin_orders():
-    orders = Order.query.filter(Order.status != "cart").order_by(Order.created_at.desc()).all()
-    return render_template('admin_orders.html', orders=orders)
+    conditions, filters = _order_filters()
+
+    # Items, their stickers, the customer and the payment are loaded with the page
+    # (one selectin query for the items + stickers) instead of lazily per order
+    sources = [(Order.query.options(
+        selectinload(Order.order_items).joinedload(OrderItem.sticker),
+        joinedload(Order.user),
+        joinedload(Order.payment)
+    ).filter(*conditions), [Order.created_at, Order.id])]
+
+    if filters['archived']:
+        archived_conditions, _ = _order_filters(ArchivedOrder)
+        sources.append((ArchivedOrder.query.options(
+            selectinload(ArchivedOrder.order_items).joinedload(ArchivedOrderItem.sticker),
+            joinedload(ArchivedOrder.user),
+            joinedload(ArchivedOrder.payment)
+        ).filter(*archived_conditions), [ArchivedOrder.created_at, ArchivedOrder.id]))
+
+    page = paginate_union(sources, descending=True)
+    return render_template(
+        'admin_orders.html',
+        orders=page,
+        page=page,
+        statuses=ORDER_STATUSES,
+        filters=filters
+    )
+
+
+@admin.route('/admin_orders/export')
+@admin_required
+def export_orders():
+    # One row per order line with the order and payment columns, streamed as it is read
+    conditions, filters = _order_filters()
+    archived_conditions = _order_filters(ArchivedOrder)[0] if filters['archived'] else None
+    fmt = request.args.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        abort(400)
+
+    name = "-".join(["orders"] + [v for k, v in filters.items() if v and k != 'archived'])
+    return Response(
+        stream_with_context(export_order_lines(conditions, fmt, archived_conditions)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={name}.{fmt}"}
+    )
 
 
 
+@admin.route('/analytics')
+@admin_required
+def analytics():
+    # Reads only the daily rollup tables, so the cost doesn't grow with the order count
+    days = max(1, min(request.args.get('days', 30, type=int), 366))
+    return render_template('analytics.html', stats=dashboard(days))
+
+
 @admin.route("/add_sticker", methods=["GET", "POST"])
 @admin_required
 def add_sticker():
@@ -50,27 +146,48 @@ def add_sticker():
             flash("Category not found.", "error")
             return redirect(url_for("admin.add_sticker"))
 
-        upload_result = cloudinary.uploader.upload(file)
-        image_url = upload_result["secure_url"]
-
+        # The sticker goes live once the upload worker has stored its image
         new_sticker = Sticker(
             name=name,
             price=Decimal(price),
             category_id=category_obj.id,
             description=description,
-            image_url=image_url,
+            image_url="",
             stock=int(stock),
+            is_active=False,
         )
 
         db.session.add(new_sticker)
+        db.session.flush()
+        enqueue_upload(file, new_sticker, activate=True)
         db.session.commit()
+        index_sticker(new_sticker)
 
-        flash("Sticker added successfully!", "success")
+        flash("Sticker added! It will appear in the shop as soon as its image is uploaded.", "success")
         return redirect(url_for("admin.add_sticker"))
 
     return render_template("add_sticker.html", categories=categories)
 
 
+@admin.route("/import_stickers", methods=["GET", "POST"])
+@admin_required
+def import_stickers_view():
+    report = None
+    if request.method == "POST":
+        csv_file = request.files.get("csv")
+        if not csv_file or csv_file.filename == "":
+            flash("A CSV file is required.", "error")
+            return redirect(url_for("admin.import_stickers_view"))
+
+        zip_file = request.files.get("images")
+        if zip_file and zip_file.filename == "":
+            zip_file = None
+        report = import_stickers(csv_file.stream, zip_file.stream if zip_file else None)
+        flash(f"{report.created} stickers added, {report.updated} updated.", "success" if not report.errors else "warning")
+
+    return render_template("import_stickers.html", report=report)
+
+
 @admin.route('/approve_request/<int:request_id>', methods=['POST'])
 @admin_required
 def approve_request(request_id):
@@ -111,6 +228,7 @@ def deny_request(request_id):
             sticker.is_active = False
         else:
             db.session.delete(sticker)
+        bump_catalog_version()
         db.session.commit()
 
     flash(f"Request '{request_name}' denied.", "info")
@@ -135,12 +253,14 @@ def add_request_to_dashboard(request_id):
         flash(f"'{custom.name}' already exists in the shop, linked to request.", "info")
         return redirect(url_for('admin.index_admin'))
 
-    # Upload image to cloud if not already uploaded
-    if custom.image_url:  # If already has a cloud URL
-        image_url = custom.image_url
-    else:
-        flash("Custom sticker image missing. Please upload it first.", "warning")
-        image_url = None
+    # The request image is stored by the upload worker; until then there is nothing to show
+    if not custom.image_url:
+        if custom.image_status == "pending":
+            flash("The image for this request is still being uploaded, try again in a moment.", "warning")
+        else:
+            flash("Custom sticker image missing. Please upload it first.", "warning")
+        return redirect(url_for('admin.suggestions'))
+    image_url = custom.image_url
 
     # Create the Sticker in DB
     sticker = Sticker(
@@ -160,7 +280,9 @@ def add_request_to_dashboard(request_id):
     # Link custom sticker to newly created shop sticker
     custom.sticker_id = sticker.id
     custom.approval_status = "added_to_shop"
+    bump_catalog_version()
     db.session.commit()
+    index_sticker(sticker)
 
     flash(f"'{custom.name}' added to shop (hidden)", "success")
     return redirect(url_for('admin.index_admin'))
@@ -171,14 +293,17 @@ def add_request_to_dashboard(request_id):
 @admin.route('/index_admin')
 @admin_required
 def index_admin():
-    stickers = Sticker.query.filter(Sticker.is_active == True).all()
-    return render_template('index_admin.html', stickers=stickers)
+    page = paginate(Sticker.query.filter(Sticker.is_active == True), [Sticker.id])
+    # Live stock is kept in shards, read for the whole page at once
+    stock = on_hand_stock([sticker.id for sticker in page])
+    return render_template('index_admin.html', stickers=page, page=page, stock=stock)
 
 @admin.route('/suggestions')
 @admin_required
 def suggestions():
-    suggestions = CustomSticker.query.order_by(CustomSticker.created_at.desc()).all()
-    return render_template('suggestions.html', suggestions=suggestions)
+    page = paginate(CustomSticker.query, [CustomSticker.created_at, CustomSticker.id], descending=True)
+    duplicates = duplicate_requests(page.items)
+    return render_template('suggestions.html', suggestions=page, page=page, duplicates=duplicates)
 
 
 
@@ -191,7 +316,6 @@ def edit_sticker(sticker_id):
         # Update text fields
         sticker.name = request.form.get('name')
         sticker.price = float(request.form.get('price'))
-        sticker.stock = int(request.form.get('stock'))
         sticker.description = request.form.get('description')
 
         # Update Category
@@ -203,17 +327,21 @@ def edit_sticker(sticker_id):
         # Handle optional image update
         file = request.files.get('image')
         if file and file.filename != '' and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
+            # The current image stays until the upload worker has stored the new one
+            enqueue_upload(file, sticker)
 
-            upload_result = cloudinary.uploader.upload(file)
-            sticker.image_url = upload_result['secure_url']
+        # Stock changes go through the inventory ledger, not Sticker.stock
+        adjust_stock(sticker.id, int(request.form.get('stock')))
 
+        bump_catalog_version()
         db.session.commit()
+        index_sticker(sticker)
         flash("Sticker updated successfully!", "success")
         return redirect(url_for('admin.index_admin'))
 
     categories = Category.query.all()
-    return render_template('edit_sticker.html', sticker=sticker, categories=categories)
+    stock = on_hand_stock([sticker.id]).get(sticker.id, sticker.stock)
+    return render_template('edit_sticker.html', sticker=sticker, categories=categories, stock=stock)
 
 
 @admin.route("/order/<int:order_id>/status/<string:new_status>", methods=["POST"])
@@ -221,18 +349,19 @@ def edit_sticker(sticker_id):
 def update_order_status(order_id, new_status):
     order = Order.query.get_or_404(order_id)
 
-    allowed_statuses = ["pending", "confirmed", "finished", "cancelled"]
     new_status = new_status.lower().strip()
 
-    if new_status not in allowed_statuses:
+    # Back to the same filtered page of the orders list
+    if new_status not in ORDER_STATUSES:
         flash("Invalid status", "danger")
-        return redirect(url_for("admin.admin_orders"))
+        return redirect(request.referrer or url_for("admin.admin_orders"))
 
+    record_order_change(order.id, order.status, new_status)
     order.status = new_status
     db.session.commit()
 
     flash(f"Order #{order.id} marked as {new_status}", "success")
-    return redirect(url_for("admin.admin_orders"))
+    return redirect(request.referrer or url_for("admin.admin_orders"))
 
 @admin.route('/order/<int:order_id>/delete', methods=['POST'])
 @admin_required
@@ -240,6 +369,7 @@ def delete_order(order_id):
     print("🔥 DELETE ROUTE HIT FOR ORDER:", order_id)
 
     order = Order.query.get_or_404(order_id)
+    record_order_change(order.id, order.status, None)
     db.session.delete(order)
     db.session.commit()
     return redirect(url_for('admin.admin_orders'))
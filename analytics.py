@@ -0,0 +1,187 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from sqlalchemy import and_, func, insert, select, union_all
+from models import (
+    Order, OrderItem, ArchivedOrder, ArchivedOrderItem, Sticker, Category,
+    DailyOrderStats, DailyStickerSales, DailyCategorySales
+)
+from utils import dialect_insert
+from extensions import db
+
+
+# Statuses whose items count as sold. A cancelled order still shows up in the
+# orders per status, but its units and revenue are taken back out.
+SOLD_STATUSES = ("pending", "confirmed", "finished")
+
+
+def _day(value):
+    return value.date() if isinstance(value, datetime) else value
+
+
+def _add(model, keys, rows):
+    # Adds the counters in rows onto the rollup rows with the same keys, creating them
+    # when missing. One multi-row upsert on Postgres/SQLite.
+    rows = [row for row in rows if any(row[k] for k in row if k not in keys)]
+    if not rows:
+        return
+
+    counters = [k for k in rows[0] if k not in keys]
+    stmt = dialect_insert(model)
+    if stmt is not None:
+        stmt = stmt.values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={k: getattr(model, k) + getattr(stmt.excluded, k) for k in counters}
+        )
+        db.session.execute(stmt)
+        return
+
+    for row in rows:
+        existing = db.session.get(model, tuple(row[k] for k in keys))
+        if existing is None:
+            db.session.add(model(**row))
+        else:
+            for k in counters:
+                setattr(existing, k, getattr(existing, k) + row[k])
+    db.session.flush()
+
+
+def record_order_change(order_id, old_status, new_status):
+    # Moves an order's contribution in the rollups from old_status to new_status.
+    # old_status None means a new order, new_status None a deleted one. Carts are
+    # never counted. Runs in the caller's transaction; call it before a delete.
+    old_status = None if old_status == "cart" else old_status
+    new_status = None if new_status == "cart" else new_status
+    if old_status == new_status:
+        return
+
+    created_at, total = db.session.query(Order.created_at, Order.total_price).filter(Order.id == order_id).one()
+    if created_at is None:
+        # Legacy orders without a date have no day to count under (backfill skips them too)
+        return
+    day = _day(created_at)
+    total = total or Decimal("0.00")
+
+    status_rows = []
+    if old_status:
+        status_rows.append({"day": day, "status": old_status, "orders": -1, "revenue": -total})
+    if new_status:
+        status_rows.append({"day": day, "status": new_status, "orders": 1, "revenue": total})
+    _add(DailyOrderStats, ["day", "status"], status_rows)
+
+    was_sold = old_status in SOLD_STATUSES
+    is_sold = new_status in SOLD_STATUSES
+    if was_sold == is_sold:
+        return
+
+    sign = 1 if is_sold else -1
+    items = db.session.query(
+        OrderItem.sticker_id, Sticker.category_id, OrderItem.quantity, OrderItem.price_at_time
+    ).join(Sticker).filter(OrderItem.order_id == order_id).all()
+
+    stickers, categories = {}, {}
+    for sticker_id, category_id, quantity, price in items:
+        quantity = quantity or 0
+        amount = (price or 0) * quantity
+        for totals, key in ((stickers, sticker_id), (categories, category_id)):
+            units, revenue = totals.get(key, (0, Decimal("0.00")))
+            totals[key] = (units + quantity, revenue + amount)
+
+    _add(DailyStickerSales, ["day", "sticker_id"], [
+        {"day": day, "sticker_id": key, "units": sign * units, "revenue": sign * revenue}
+        for key, (units, revenue) in stickers.items()
+    ])
+    _add(DailyCategorySales, ["day", "category_id"], [
+        {"day": day, "category_id": key, "units": sign * units, "revenue": sign * revenue}
+        for key, (units, revenue) in categories.items()
+    ])
+
+
+def backfill_analytics():
+    # Rebuilds every rollup from the order history (live and archived orders) with
+    # three INSERT ... SELECTs. Takes a table-wide pass over orders, so run it from
+    # the CLI, not from a request.
+    orders = union_all(
+        select(Order.id, Order.created_at, Order.status, Order.total_price),
+        select(ArchivedOrder.id, ArchivedOrder.created_at, ArchivedOrder.status, ArchivedOrder.total_price),
+    ).subquery()
+    items = union_all(
+        select(OrderItem.order_id, OrderItem.sticker_id, OrderItem.quantity, OrderItem.price_at_time),
+        select(ArchivedOrderItem.order_id, ArchivedOrderItem.sticker_id, ArchivedOrderItem.quantity, ArchivedOrderItem.price_at_time),
+    ).subquery()
+
+    day = func.date(orders.c.created_at)
+    # Same rule as record_order_change: orders without created_at are not counted
+    dated = orders.c.created_at.isnot(None)
+    sold = and_(dated, orders.c.status.in_(SOLD_STATUSES))
+    line_total = items.c.price_at_time * items.c.quantity
+
+    for model in (DailyOrderStats, DailyStickerSales, DailyCategorySales):
+        db.session.query(model).delete(synchronize_session=False)
+
+    db.session.execute(insert(DailyOrderStats).from_select(
+        ["day", "status", "orders", "revenue"],
+        select(day, orders.c.status, func.count(orders.c.id), func.coalesce(func.sum(orders.c.total_price), 0))
+        .where(dated, orders.c.status.isnot(None), orders.c.status != "cart")
+        .group_by(day, orders.c.status)
+    ))
+    db.session.execute(insert(DailyStickerSales).from_select(
+        ["day", "sticker_id", "units", "revenue"],
+        select(day, items.c.sticker_id, func.coalesce(func.sum(items.c.quantity), 0), func.coalesce(func.sum(line_total), 0))
+        .select_from(items)
+        .join(orders, items.c.order_id == orders.c.id)
+        .where(sold)
+        .group_by(day, items.c.sticker_id)
+    ))
+    db.session.execute(insert(DailyCategorySales).from_select(
+        ["day", "category_id", "units", "revenue"],
+        select(day, Sticker.category_id, func.coalesce(func.sum(items.c.quantity), 0), func.coalesce(func.sum(line_total), 0))
+        .select_from(items)
+        .join(orders, items.c.order_id == orders.c.id)
+        .join(Sticker, items.c.sticker_id == Sticker.id)
+        .where(sold)
+        .group_by(day, Sticker.category_id)
+    ))
+    db.session.commit()
+
+
+def dashboard(days=30, top=10):
+    # Everything the analytics page shows, read from the rollups only
+    since = date.today() - timedelta(days=days - 1)
+
+    per_day = db.session.query(
+        DailyOrderStats.day,
+        func.sum(DailyOrderStats.orders),
+        func.sum(DailyOrderStats.revenue)
+    ).filter(
+        DailyOrderStats.day >= since, DailyOrderStats.status.in_(SOLD_STATUSES)
+    ).group_by(DailyOrderStats.day).order_by(DailyOrderStats.day).all()
+
+    per_status = db.session.query(
+        DailyOrderStats.status, func.sum(DailyOrderStats.orders)
+    ).filter(DailyOrderStats.day >= since).group_by(DailyOrderStats.status).all()
+
+    units = func.sum(DailyStickerSales.units)
+    top_stickers = db.session.query(
+        Sticker.name, units, func.sum(DailyStickerSales.revenue)
+    ).join(Sticker, Sticker.id == DailyStickerSales.sticker_id).filter(
+        DailyStickerSales.day >= since
+    ).group_by(Sticker.id, Sticker.name).having(units > 0).order_by(units.desc()).limit(top).all()
+
+    category_units = func.sum(DailyCategorySales.units)
+    categories = db.session.query(
+        Category.name, category_units, func.sum(DailyCategorySales.revenue)
+    ).join(Category, Category.id == DailyCategorySales.category_id).filter(
+        DailyCategorySales.day >= since
+    ).group_by(Category.id, Category.name).order_by(category_units.desc()).all()
+
+    return {
+        "days": days,
+        "since": since,
+        "revenue": sum((row[2] or 0 for row in per_day), Decimal("0.00")),
+        "orders": sum(row[1] or 0 for row in per_day),
+        "per_day": per_day,
+        "per_status": {status: count for status, count in per_status if count},
+        "top_stickers": top_stickers,
+        "categories": categories,
+    }
@@ -1,17 +1,32 @@
 import os
+import click
 import cloudinary
+import time
+from datetime import timedelta
 from flask import Flask, session, request, redirect
-from seed_stickers import generate_stickers, clear_stickers
-from utils import create_default_categories
+from utils import current_user, navbar_categories, current_cart_item_count
+from search import ensure_search_index, rebuild_search_index
+from email_utils import run_outbox_worker, EMAIL_BATCH_SIZE
+from analytics import backfill_analytics
+from archive import run_archiver, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from uploads import run_upload_worker
+from images import build_variants, sticker_image
+from catalog_cache import bump_catalog_version
+from bootstrap import run_bootstrap
+from fixtures import read_fixture_file, load_stickers, generate_synthetic
+from query_plans import check_query_plans
+from inventory import release_expired_reservations, compact_inventory
 from flask_babel import Babel, gettext as _
 from extensions import db, migrate, mail
-from models import User, Order, Category
+from database import configure_database
+from models import Sticker, IdempotencyKey, utcnow
 from dotenv import load_dotenv
 from payments import payments
 from admin import admin
 from auth import auth
 from shop import shop
 from flask import send_from_directory, render_template
+from werkzeug.local import LocalProxy
 import cloudinary
 import cloudinary.uploader
 
@@ -33,10 +48,12 @@ def create_app():
     # if not database_url:
     #     database_url = "sqlite:///app.db"
 
-    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    # Pool settings and the optional read replica come from env, see database.py
+    configure_database(app, database_url)
     
 
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['PAGE_SIZE'] = int(os.getenv("PAGE_SIZE", 24))
     app.secret_key = os.getenv("FLASK_SECRET_KEY")
 
     db.init_app(app)
@@ -48,9 +65,11 @@ def create_app():
     Babel(app, locale_selector=get_locale)
 
     app.config.update(
-        MAIL_SERVER='smtp.gmail.com',
-        MAIL_PORT=587,
-        MAIL_USE_TLS=True,
+        # Point these at a local debugging server (python -m aiosmtpd -n -l localhost:8025)
+        # with MAIL_USE_TLS=false to try the outbox worker without sending real mail
+        MAIL_SERVER=os.getenv("MAIL_SERVER", 'smtp.gmail.com'),
+        MAIL_PORT=int(os.getenv("MAIL_PORT", 587)),
+        MAIL_USE_TLS=os.getenv("MAIL_USE_TLS", "true").lower() == "true",
         MAIL_USE_SSL=False,
         MAIL_USERNAME=os.getenv("MAIL_USERNAME"),
         MAIL_PASSWORD=os.getenv("MAIL_PASSWORD"),
@@ -92,29 +111,22 @@ def create_app():
 
 
     # This runs for EVERY template in the app (Shop, Admin, Auth, etc.)
+    # The values are lazy: nothing is queried unless the template actually uses it,
+    # and each one is loaded at most once per request (memoized on flask.g)
     @app.context_processor
     def inject_global_context():
-        # 1. User
-        user = None
-        if 'user_id' in session:
-            user = User.query.get(session['user_id'])
-
-        # 2. Categories (for the Navbar dropdown)
-        categories = Category.query.all()
-
-        # 3. Cart Count (for the Navbar badge)
-        cart_item_count = 0
-        if 'user_id' in session:
-            order = Order.query.filter_by(user_id=session['user_id'], status="cart").first()
-            if order and order.order_items:
-                cart_item_count = sum(item.quantity for item in order.order_items)
-
         return dict(
-            user=user, 
-            categories=categories, 
-            cart_item_count=cart_item_count
+            # 1. User
+            user=LocalProxy(current_user),
+            # 2. Categories (for the Navbar dropdown), from the catalog cache
+            categories=LocalProxy(navbar_categories),
+            # 3. Cart Count (for the Navbar badge), one SUM(quantity) query
+            cart_item_count=LocalProxy(current_cart_item_count)
         )
 
+    # {{ sticker_image(sticker) }}: responsive <picture> with the resized variants
+    app.add_template_global(sticker_image)
+
     # Route to change language - users click this to switch between English/Dutch
     @app.route('/set-language/<language>')
     def set_language(language):
@@ -122,32 +134,127 @@ def create_app():
         return redirect(request.referrer or '/') 
 
 
-    with app.app_context():
-        admin_old = User.query.filter_by(username="Admin").first()
-
-        if admin_old:
-            admin_old.is_admin = False
-            db.session.commit()
-            print("User 'Admin' is no longer an admin!")
-
-        # admin = User.query.filter_by(username="Admin2").first()
-
-        # if admin:
-        #     admin.is_admin = True
-        #     db.session.commit()
-        #     print("User 'Admin2' is no longer an admin!")
-
-
-        db.create_all()
-        try:
-            if not Category.query.first():
-                create_default_categories()
-
-        except Exception as e:
-            print("Category init error:", e)
-        
-        # clear_stickers() #call to clear existing stickers
-        generate_stickers()
+    # Schema and seed data are set up by `flask bootstrap` (run once per deploy,
+    # before starting gunicorn), so booting a worker does no database work
+    @app.cli.command("bootstrap")
+    @click.option("--force", is_flag=True, help="Run every step, even ones that already ran")
+    def bootstrap_command(force):
+        ran = run_bootstrap(force)
+        print(f"Bootstrap steps run: {', '.join(ran) or 'none'}")
+
+    # Load categories and stickers from a JSON file in the STICKERS_DATA format
+    @app.cli.command("load-fixtures")
+    @click.argument("path", type=click.Path(exists=True, dir_okay=False))
+    @click.option("--update", is_flag=True, help="Overwrite price, category, description and image of existing stickers")
+    def load_fixtures_command(path, update):
+        loaded = load_stickers(read_fixture_file(path), update=update)
+        print(f"Loaded {loaded} stickers")
+
+    # Fill a development or staging database with synthetic users, stickers and orders
+    @app.cli.command("generate-data")
+    @click.option("--users", default=0, help="Number of users to create")
+    @click.option("--stickers", default=0, help="Number of stickers to create")
+    @click.option("--orders", default=0, help="Number of orders to create")
+    @click.option("--batch-size", default=5000, help="Rows per INSERT and per commit")
+    @click.option("--seed", default=None, type=int, help="Random seed, for reproducible data")
+    def generate_data(users, stickers, orders, batch_size, seed):
+        started = time.monotonic()
+        generate_synthetic(users, stickers, orders, batch_size, seed)
+        print(f"Generated {users} users, {stickers} stickers and {orders} orders in {time.monotonic() - started:.1f}s")
+
+    # EXPLAIN the queries behind the main pages; exits with 1 when one of them scans
+    # a large table without an index. Run after migrations, on a generate-data database.
+    @app.cli.command("check-query-plans")
+    @click.option("--max-rows", default=1000, help="Tables up to this size may be scanned")
+    def check_query_plans_command(max_rows):
+        problems, checked = check_query_plans(app, max_rows)
+        for route, table, rows, statement in problems:
+            print(f"{route}: sequential scan on {table} ({rows} rows)\n    {' '.join(statement.split())}")
+        print(f"Checked {checked} queries, {len(problems)} sequential scans")
+        if problems:
+            raise SystemExit(1)
+
+    # Rebuild the search index from scratch: flask reindex-search
+    @app.cli.command("reindex-search")
+    def reindex_search():
+        ensure_search_index()
+        rebuild_search_index()
+        print("Search index rebuilt")
+
+    # Release expired stock holds in bulk, once or every --interval seconds
+    @app.cli.command("sweep-reservations")
+    @click.option("--interval", default=0, help="Keep running, sweeping every N seconds")
+    def sweep_reservations(interval):
+        while True:
+            print(f"Released {release_expired_reservations()} expired reservations")
+            if not interval:
+                break
+            time.sleep(interval)
+
+    # Fold the inventory ledger into Sticker.stock, once or every --interval seconds
+    @app.cli.command("compact-inventory")
+    @click.option("--interval", default=0, help="Keep running, compacting every N seconds")
+    def compact_inventory_command(interval):
+        while True:
+            print(f"Compacted {compact_inventory()} inventory movements")
+            if not interval:
+                break
+            time.sleep(interval)
+
+    # Rebuild the sales rollups behind /analytics from the full order history
+    @app.cli.command("backfill-analytics")
+    def backfill_analytics_command():
+        backfill_analytics()
+        print("Analytics rollups rebuilt")
+
+    # Move old finished/cancelled orders to the archive tables, once or every --interval seconds
+    @app.cli.command("archive-orders")
+    @click.option("--days", default=ARCHIVE_AFTER_DAYS, help="Archive completed orders older than this many days")
+    @click.option("--batch-size", default=ARCHIVE_BATCH_SIZE, help="Orders moved per transaction")
+    @click.option("--interval", default=0, help="Keep running, archiving every N seconds")
+    def archive_orders_command(days, batch_size, interval):
+        run_archiver(interval, days, batch_size)
+
+    # Push spooled sticker images to the storage backend
+    @app.cli.command("process-uploads")
+    @click.option("--interval", default=0, help="Keep running, polling for uploads every N seconds")
+    def process_uploads_command(interval):
+        run_upload_worker(interval)
+
+    # Create resized copies of sticker images that don't have them yet (or all with --force)
+    @app.cli.command("build-image-variants")
+    @click.option("--force", is_flag=True, help="Rebuild variants for every sticker")
+    def build_image_variants(force):
+        query = Sticker.query
+        if not force:
+            query = query.filter(Sticker.image_variants.is_(None))
+        built = 0
+        for sticker in query.all():
+            try:
+                sticker.image_variants = build_variants(sticker.image_url)
+            except OSError as e:
+                print(f"Skipped {sticker.name}: {e}")
+                continue
+            built += 1
+        bump_catalog_version()
+        db.session.commit()
+        print(f"Built image variants for {built} stickers")
+
+    # Deliver queued emails over one SMTP connection per batch
+    @app.cli.command("send-emails")
+    @click.option("--interval", default=0, help="Keep running, polling the outbox every N seconds")
+    @click.option("--batch-size", default=EMAIL_BATCH_SIZE, help="Messages sent per SMTP connection")
+    def send_emails(interval, batch_size):
+        run_outbox_worker(interval, batch_size)
+
+    # Checkout idempotency keys only matter while a client may still retry
+    @app.cli.command("purge-idempotency-keys")
+    @click.option("--days", default=7, help="Delete keys older than this many days")
+    def purge_idempotency_keys(days):
+        cutoff = utcnow() - timedelta(days=days)
+        deleted = IdempotencyKey.query.filter(IdempotencyKey.created_at < cutoff).delete()
+        db.session.commit()
+        print(f"Deleted {deleted} idempotency keys")
 
 
     return app
@@ -0,0 +1,71 @@
+import os
+import time
+from datetime import timedelta
+from sqlalchemy import delete, insert, literal, select
+from models import (
+    Order, OrderItem, Payment, StockReservation, ArchivedOrder, ArchivedOrderItem, ArchivedPayment, utcnow
+)
+from extensions import db
+
+
+# Finished and cancelled orders older than this are moved to the archive tables
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 180))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 1000))
+ARCHIVE_STATUSES = ("finished", "cancelled")
+
+
+def _copy(source, target, condition, archived_at):
+    # INSERT INTO <archive> SELECT ... FROM <live>, column for column
+    columns = [column.name for column in source.__table__.columns]
+    values = [source.__table__.c[name] for name in columns]
+    if "archived_at" in target.__table__.columns:
+        columns.append("archived_at")
+        values.append(literal(archived_at, target.__table__.c.archived_at.type))
+    db.session.execute(insert(target).from_select(columns, select(*values).where(condition)))
+
+
+def archive_batch(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    # Moves one batch of old completed orders, with their items and payment, to the
+    # archive in one transaction. Returns how many orders were moved.
+    # created_at is written with utcnow(), a local clock would shift the window
+    cutoff = utcnow() - timedelta(days=days)
+    # SKIP LOCKED: orders an admin is updating right now wait for the next batch
+    ids = [
+        order_id for (order_id,) in db.session.query(Order.id).filter(
+            Order.status.in_(ARCHIVE_STATUSES),
+            Order.created_at < cutoff
+        ).order_by(Order.id).limit(batch_size).with_for_update(skip_locked=True)
+    ]
+    if not ids:
+        db.session.rollback()
+        return 0
+
+    now = utcnow()
+    _copy(Order, ArchivedOrder, Order.id.in_(ids), now)
+    _copy(OrderItem, ArchivedOrderItem, OrderItem.order_id.in_(ids), now)
+    _copy(Payment, ArchivedPayment, Payment.order_id.in_(ids), now)
+
+    db.session.execute(delete(StockReservation).where(StockReservation.order_id.in_(ids)))
+    db.session.execute(delete(Payment).where(Payment.order_id.in_(ids)))
+    db.session.execute(delete(OrderItem).where(OrderItem.order_id.in_(ids)))
+    db.session.execute(delete(Order).where(Order.id.in_(ids)))
+    db.session.commit()
+    return len(ids)
+
+
+def archive_orders(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    # Archives batches until nothing is left; small transactions keep locks short
+    total = 0
+    while True:
+        moved = archive_batch(days, batch_size)
+        if not moved:
+            return total
+        total += moved
+
+
+def run_archiver(interval=0, days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE):
+    while True:
+        print(f"Archived {archive_orders(days, batch_size)} orders")
+        if not interval:
+            break
+        time.sleep(interval)
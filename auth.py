@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from models import User
 from extensions import db
+from cart import merge_guest_cart
 
 auth = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -13,6 +14,8 @@ def login():
         if user and user.check_password(password):
             session['username'] = user.username
             session['user_id'] = user.id
+            merge_guest_cart(user.id)
+            db.session.commit()
 
             if user.is_admin:
                 flash("Welcome back, Admin!", "success")
@@ -46,6 +49,8 @@ def signup():
             new_user = User(username=username, email=email)
             new_user.set_password(password)
             db.session.add(new_user)
+            db.session.flush()
+            merge_guest_cart(new_user.id)
             db.session.commit()
             session['username'] = new_user.username
             session['user_id'] = new_user.id
@@ -0,0 +1,85 @@
+from contextlib import contextmanager
+from sqlalchemy import text
+from models import User, BootstrapStep, utcnow
+from utils import create_default_categories, dialect_insert
+from seed_stickers import generate_stickers
+from search import ensure_search_index
+from extensions import db
+
+
+# Arbitrary key for pg_advisory_lock, shared by every process running `flask bootstrap`
+BOOTSTRAP_LOCK_KEY = 727_001
+
+
+def _demote_old_admin():
+    demoted = User.query.filter_by(username="Admin", is_admin=True).update({"is_admin": False})
+    db.session.commit()
+    if demoted:
+        print("User 'Admin' is no longer an admin!")
+
+
+def _create_schema():
+    db.create_all()
+    # Full-text search index (tsvector/pg_trgm on Postgres, FTS5 on SQLite)
+    ensure_search_index()
+
+
+# (name, version, function), run in this order. Bump a version to make the step
+# run again on the next deploy. The schema step has no version and always runs:
+# create_all only creates tables that are missing, so new models need no bump.
+STEPS = [
+    ("schema", None, _create_schema),
+    ("demote-admin", 1, _demote_old_admin),
+    ("categories", 1, create_default_categories),
+    ("seed-stickers", 1, generate_stickers),
+]
+
+
+@contextmanager
+def bootstrap_lock():
+    # Session-level advisory lock on its own connection, so concurrent deploys or
+    # instances run the steps one at a time. SQLite is a single local file, there
+    # is nobody to race with.
+    if db.engine.dialect.name != "postgresql":
+        yield
+        return
+
+    with db.engine.connect() as connection:
+        connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": BOOTSTRAP_LOCK_KEY})
+        try:
+            yield
+        finally:
+            connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": BOOTSTRAP_LOCK_KEY})
+            connection.commit()
+
+
+def _mark(name, version):
+    values = {"name": name, "version": version, "applied_at": utcnow()}
+    stmt = dialect_insert(BootstrapStep)
+    if stmt is None:
+        db.session.merge(BootstrapStep(**values))
+    else:
+        stmt = stmt.values(values)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=["name"],
+            set_={"version": stmt.excluded.version, "applied_at": stmt.excluded.applied_at}
+        ))
+    db.session.commit()
+
+
+def run_bootstrap(force=False):
+    # Creates the schema and seed data. Safe to run on every deploy: each step runs
+    # once per version, under a lock. Returns the names of the steps that ran.
+    ran = []
+    with bootstrap_lock():
+        BootstrapStep.__table__.create(db.engine, checkfirst=True)
+        applied = dict(db.session.query(BootstrapStep.name, BootstrapStep.version).all())
+        db.session.commit()
+
+        for name, version, step in STEPS:
+            if version is not None and not force and applied.get(name, 0) >= version:
+                continue
+            step()
+            _mark(name, version or 0)
+            ran.append(name)
+    return ran
@@ -0,0 +1,283 @@
+from collections import namedtuple
+from decimal import Decimal
+from flask import session
+from sqlalchemy import func, select, text, update
+from models import Order, OrderItem, Sticker, utcnow
+from utils import cart_item_count, dialect_insert, GUEST_CART_KEY
+from catalog_cache import get_catalog
+from extensions import db
+
+
+# Cart writes use INSERT ... ON CONFLICT so two concurrent clicks can never create
+# a second cart (partial unique index on user_id) or a second line for the same
+# sticker (unique order_id + sticker_id). Both Postgres and SQLite support this.
+
+def get_or_create_cart_id(user_id):
+    stmt = dialect_insert(Order)
+    if stmt is None:
+        order = Order.query.filter_by(user_id=user_id, status="cart").first()
+        if not order:
+            order = Order(user_id=user_id, created_at=utcnow(), status="cart", total_price=Decimal("0.00"))
+            db.session.add(order)
+            db.session.flush()
+        return order.id
+
+    stmt = stmt.values(
+        user_id=user_id,
+        created_at=utcnow(),
+        status="cart",
+        total_price=Decimal("0.00")
+    )
+    # A no-op update instead of DO NOTHING, so RETURNING also gives back an existing cart
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Order.user_id],
+        index_where=text("status = 'cart'"),
+        set_={"user_id": stmt.excluded.user_id}
+    ).returning(Order.id)
+    return db.session.execute(stmt).scalar_one()
+
+
+def _upsert_lines(order_id, lines):
+    # lines: [(sticker_id, price, quantity)], written as one multi-row upsert
+    stmt = dialect_insert(OrderItem)
+    if stmt is None:
+        for sticker_id, price, quantity in lines:
+            item = OrderItem.query.filter_by(order_id=order_id, sticker_id=sticker_id).first()
+            if item:
+                item.quantity += quantity
+            else:
+                db.session.add(OrderItem(quantity=quantity, price_at_time=price, sticker_id=sticker_id, order_id=order_id))
+        db.session.flush()
+        return
+
+    stmt = stmt.values([
+        {
+            "order_id": order_id,
+            "sticker_id": sticker_id,
+            "quantity": quantity,
+            "price_at_time": price,
+        }
+        for sticker_id, price, quantity in lines
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[OrderItem.order_id, OrderItem.sticker_id],
+        set_={"quantity": OrderItem.quantity + stmt.excluded.quantity}
+    )
+    db.session.execute(stmt)
+
+
+def add_item_to_cart(user_id, sticker_id, price, quantity=1):
+    # Adds quantity of a sticker to the user's cart and returns the new badge count.
+    # Runs in the caller's transaction; the caller commits.
+    price = Decimal(str(price))
+    order_id = get_or_create_cart_id(user_id)
+    _upsert_lines(order_id, [(sticker_id, price, quantity)])
+
+    db.session.execute(
+        update(Order)
+        .where(Order.id == order_id)
+        .values(total_price=Order.total_price + price * quantity)
+    )
+    return cart_item_count(user_id)
+
+
+def recompute_cart_total(order_id):
+    line_totals = select(
+        func.coalesce(func.sum(OrderItem.price_at_time * OrderItem.quantity), 0)
+    ).where(OrderItem.order_id == order_id).scalar_subquery()
+    db.session.execute(update(Order).where(Order.id == order_id).values(total_price=line_totals))
+
+
+def _int_field(value, field):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError(f"'{field}' must be an integer")
+    return value
+
+
+def _parse_operation(operation):
+    # Returns (op, id, quantity). id is a sticker id for "add" and a cart line id
+    # for "set"; "remove" is a "set" to 0.
+    if not isinstance(operation, dict):
+        raise ValueError("Every operation must be an object")
+    op = operation.get("op")
+
+    if op == "add":
+        sticker_id = _int_field(operation.get("sticker_id"), "sticker_id")
+        quantity = _int_field(operation.get("quantity", 1), "quantity")
+        if quantity < 1:
+            raise ValueError("'quantity' must be at least 1")
+        return "add", sticker_id, quantity
+
+    if op in ("set", "remove"):
+        item_id = _int_field(operation.get("item_id"), "item_id")
+        quantity = 0 if op == "remove" else _int_field(operation.get("quantity"), "quantity")
+        if quantity < 0:
+            raise ValueError("'quantity' cannot be negative")
+        return "set", item_id, quantity
+
+    raise ValueError(f"Unknown operation '{op}'")
+
+
+def apply_cart_operations(user_id, operations):
+    # Applies a list of add / set / remove operations to the user's cart in the
+    # caller's transaction, recomputes the total once and returns the cart state.
+    #   {"op": "add", "sticker_id": 3, "quantity": 1}
+    #   {"op": "set", "item_id": 12, "quantity": 4}   (0 removes the line)
+    #   {"op": "remove", "item_id": 12}
+    order_id = db.session.query(Order.id).filter_by(user_id=user_id, status="cart").scalar()
+
+    for operation in operations:
+        op, target_id, quantity = _parse_operation(operation)
+
+        if op == "add":
+            price = db.session.query(Sticker.price).filter_by(id=target_id).scalar()
+            if price is None:
+                raise ValueError(f"Sticker {target_id} not found")
+            if order_id is None:
+                order_id = get_or_create_cart_id(user_id)
+            _upsert_lines(order_id, [(target_id, Decimal(str(price)), quantity)])
+            continue
+
+        if order_id is None:
+            raise ValueError(f"Item {target_id} is not in your cart")
+
+        # order_id in the WHERE makes sure users can only touch their own cart
+        lines = OrderItem.query.filter_by(id=target_id, order_id=order_id)
+        if quantity > 0:
+            changed = lines.update({"quantity": quantity}, synchronize_session=False)
+        else:
+            changed = lines.delete(synchronize_session=False)
+        if not changed:
+            raise ValueError(f"Item {target_id} is not in your cart")
+
+    if order_id is not None:
+        recompute_cart_total(order_id)
+    return cart_state(order_id)
+
+
+def cart_state(order_id):
+    if order_id is None:
+        return {"items": [], "total": "0.00", "total_quantity": 0}
+
+    rows = db.session.query(OrderItem, Sticker.name).join(Sticker).filter(
+        OrderItem.order_id == order_id
+    ).order_by(OrderItem.id).all()
+    total = db.session.query(Order.total_price).filter_by(id=order_id).scalar() or 0
+
+    items = [
+        {
+            "item_id": item.id,
+            "sticker_id": item.sticker_id,
+            "name": name,
+            "quantity": item.quantity,
+            "price": f"{item.price_at_time:.2f}",
+            "item_total": f"{item.price_at_time * item.quantity:.2f}",
+        }
+        for item, name in rows
+    ]
+    return {
+        "items": items,
+        "total": f"{total:.2f}",
+        "total_quantity": sum(item["quantity"] for item in items),
+    }
+
+
+# Guest carts: visitors who are not logged in keep their cart in the signed session
+# cookie as {"<sticker id>": quantity}, so browsing and adding never writes to the DB.
+# The cart moves into a real Order when they log in or sign up (merge_guest_cart).
+# For guest carts the "line id" is the sticker id.
+
+MAX_GUEST_CART_LINES = 50
+MAX_GUEST_LINE_QUANTITY = 99
+
+GuestCartItem = namedtuple("GuestCartItem", "id sticker quantity price_at_time")
+
+
+def guest_cart():
+    return session.get(GUEST_CART_KEY) or {}
+
+
+def _save_guest_cart(lines):
+    if lines:
+        session[GUEST_CART_KEY] = lines
+    else:
+        session.pop(GUEST_CART_KEY, None)
+
+
+def apply_guest_cart_operations(operations):
+    lines = dict(guest_cart())
+
+    for operation in operations:
+        op, sticker_id, quantity = _parse_operation(operation)
+        key = str(sticker_id)
+
+        if op == "add":
+            if key not in lines and len(lines) >= MAX_GUEST_CART_LINES:
+                raise ValueError("Your cart is full, please log in to add more stickers")
+            if not get_catalog().get(sticker_id) and not db.session.get(Sticker, sticker_id):
+                raise ValueError(f"Sticker {sticker_id} not found")
+            lines[key] = min(lines.get(key, 0) + quantity, MAX_GUEST_LINE_QUANTITY)
+        elif key not in lines:
+            raise ValueError(f"Item {sticker_id} is not in your cart")
+        elif quantity > 0:
+            lines[key] = min(quantity, MAX_GUEST_LINE_QUANTITY)
+        else:
+            del lines[key]
+
+    _save_guest_cart(lines)
+    return guest_cart_state()
+
+
+def guest_cart_items():
+    items = []
+    for key, quantity in guest_cart().items():
+        sticker_id = int(key)
+        sticker = get_catalog().get(sticker_id) or db.session.get(Sticker, sticker_id)
+        if sticker:
+            items.append(GuestCartItem(sticker_id, sticker, quantity, Decimal(str(sticker.price))))
+    return items
+
+
+def guest_cart_state():
+    cart_items = guest_cart_items()
+    items = [
+        {
+            "item_id": item.id,
+            "sticker_id": item.id,
+            "name": item.sticker.name,
+            "quantity": item.quantity,
+            "price": f"{item.price_at_time:.2f}",
+            "item_total": f"{item.price_at_time * item.quantity:.2f}",
+        }
+        for item in cart_items
+    ]
+    total = sum(item.price_at_time * item.quantity for item in cart_items)
+    return {
+        "items": items,
+        "total": f"{total:.2f}",
+        "total_quantity": sum(item["quantity"] for item in items),
+    }
+
+
+def merge_guest_cart(user_id):
+    # Moves the guest cart into the user's Order cart with one multi-row upsert.
+    # Runs in the caller's transaction; the caller commits.
+    lines = session.pop(GUEST_CART_KEY, None)
+    if not lines:
+        return
+
+    quantities = {int(key): quantity for key, quantity in lines.items()}
+    prices = dict(
+        db.session.query(Sticker.id, Sticker.price).filter(Sticker.id.in_(quantities)).all()
+    )
+    rows = [
+        (sticker_id, Decimal(str(prices[sticker_id])), quantity)
+        for sticker_id, quantity in quantities.items()
+        if sticker_id in prices
+    ]
+    if not rows:
+        return
+
+    order_id = get_or_create_cart_id(user_id)
+    _upsert_lines(order_id, rows)
+    recompute_cart_total(order_id)
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event, update
+from models import Sticker, Category, CatalogVersion, utcnow
+from database import RoutingSession
+from extensions import db
+
+
+# How long a snapshot is trusted before the shared version number is checked again.
+# Writes in this process invalidate immediately; other workers catch up within the TTL.
+CATALOG_CACHE_TTL = float(os.getenv("CATALOG_CACHE_TTL", 30))
+
+CachedSticker = namedtuple(
+    "CachedSticker",
+    "id name price description image_url image_variants stock category_id category_name is_custom updated_at"
+)
+CachedCategory = namedtuple("CachedCategory", "id name")
+
+
+class CatalogSnapshot:
+    def __init__(self, version, changed_at, stickers, categories):
+        self.version = version
+        self.loaded_at = time.monotonic()
+        # id -> CachedSticker, only active stickers
+        self.stickers = {s.id: s for s in stickers}
+        self.sticker_ids = tuple(s.id for s in stickers)
+        self.categories = {c.name: c for c in categories}
+        # Used as Last-Modified for the listing pages. Unlike the newest updated_at it
+        # also moves forward when a sticker is deactivated or deleted.
+        self.last_modified = changed_at
+        self.ids_by_category = {
+            c.name: tuple(s.id for s in stickers if s.category_id == c.id)
+            for c in categories
+        }
+
+    def get(self, sticker_id):
+        return self.stickers.get(sticker_id)
+
+    def load(self, ids):
+        return [self.stickers[i] for i in ids if i in self.stickers]
+
+
+_snapshot = None
+# Bumped by every invalidation, so a load that raced with one is not kept
+_generation = 0
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "revalidations": 0}
+
+
+def current_version():
+    # (version, changed_at)
+    row = db.session.query(CatalogVersion.version, CatalogVersion.changed_at).filter_by(id=1).first()
+    return (row.version, row.changed_at) if row else (0, None)
+
+
+def bump_catalog_version():
+    # Call inside the write transaction, before commit. The snapshot of this process
+    # is dropped when the transaction commits: dropped earlier, a request could
+    # reload the old catalog in between and keep it for CATALOG_CACHE_TTL.
+    updated = db.session.execute(
+        update(CatalogVersion).where(CatalogVersion.id == 1).values(version=CatalogVersion.version + 1, changed_at=utcnow())
+    ).rowcount
+    if not updated:
+        db.session.add(CatalogVersion(id=1, version=1, changed_at=utcnow()))
+    db.session.info["catalog_changed"] = True
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _after_commit(session):
+    if session.info.pop("catalog_changed", False):
+        invalidate_catalog()
+
+
+@event.listens_for(RoutingSession, "after_rollback")
+def _after_rollback(session):
+    session.info.pop("catalog_changed", None)
+
+
+def _build(version, changed_at):
+    rows = db.session.query(Sticker, Category.name).join(Category).filter(
+        Sticker.is_active == True
+    ).order_by(Sticker.id).all()
+
+    stickers = [
+        CachedSticker(
+            id=s.id,
+            name=s.name,
+            price=s.price,
+            description=s.description,
+            image_url=s.image_url,
+            image_variants=s.image_variants,
+            stock=s.stock,
+            category_id=s.category_id,
+            category_name=category_name,
+            is_custom=s.is_custom,
+            updated_at=s.updated_at,
+        )
+        for s, category_name in rows
+    ]
+    categories = [CachedCategory(c.id, c.name) for c in Category.query.order_by(Category.id).all()]
+    return CatalogSnapshot(version, changed_at, stickers, categories)
+
+
+def get_catalog():
+    global _snapshot
+
+    snapshot = _snapshot
+    if snapshot is not None and time.monotonic() - snapshot.loaded_at < CATALOG_CACHE_TTL:
+        _stats["hits"] += 1
+        return snapshot
+
+    with _lock:
+        snapshot = _snapshot
+        if snapshot is not None and time.monotonic() - snapshot.loaded_at < CATALOG_CACHE_TTL:
+            _stats["hits"] += 1
+            return snapshot
+
+        generation = _generation
+        version, changed_at = current_version()
+        if snapshot is not None and snapshot.version == version:
+            # Nothing changed since the last load, just extend the TTL
+            _stats["revalidations"] += 1
+            snapshot.loaded_at = time.monotonic()
+            return snapshot
+
+        _stats["misses"] += 1
+        snapshot = _build(version, changed_at)
+        if generation == _generation:
+            _snapshot = snapshot
+        return snapshot
+
+
+def invalidate_catalog():
+    global _snapshot, _generation
+    _snapshot = None
+    _generation += 1
+
+
+def catalog_stats():
+    snapshot = _snapshot
+    return dict(_stats, version=snapshot.version if snapshot else None)
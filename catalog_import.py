@@ -0,0 +1,255 @@
+import csv
+import hashlib
+import io
+import os
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import case, insert
+from models import Sticker, Category, StoredImage, utcnow
+from utils import allowed_file, dialect_insert
+from search import index_sticker
+from storage import get_storage
+from images import build_variants, perceptual_hash
+from catalog_cache import bump_catalog_version
+from inventory import adjust_stock
+from extensions import db
+
+
+# Parallel uploads to the storage backend per import; also bounds how many images are held in memory
+IMPORT_UPLOAD_WORKERS = int(os.getenv("IMPORT_UPLOAD_WORKERS", 8))
+MAX_IMPORT_ROWS = 2000
+
+# CSV header: name,price,category,description,stock,image
+# "image" is a file name inside the zip. It is optional for stickers that already
+# exist (the current image is kept) and required for new ones.
+ImportRow = namedtuple("ImportRow", "line name price category_id description stock image image_url image_variants")
+RowError = namedtuple("RowError", "line name message")
+ImportReport = namedtuple("ImportReport", "created updated errors")
+
+
+def _parse_rows(csv_file, categories, errors):
+    text = io.TextIOWrapper(csv_file, encoding="utf-8-sig", newline="")
+    rows, seen = [], set()
+
+    for line, record in enumerate(csv.DictReader(text), start=2):
+        if len(rows) >= MAX_IMPORT_ROWS:
+            errors.append(RowError(line, "", f"Only {MAX_IMPORT_ROWS} rows per import"))
+            break
+
+        name = (record.get("name") or "").strip()
+        if not name:
+            errors.append(RowError(line, "", "Name is required"))
+            continue
+        if name in seen:
+            errors.append(RowError(line, name, "Duplicate name in this file"))
+            continue
+
+        try:
+            price = Decimal((record.get("price") or "").strip())
+            stock = int((record.get("stock") or "0").strip())
+        except (InvalidOperation, ValueError):
+            errors.append(RowError(line, name, "Price and stock must be numbers"))
+            continue
+        if price < 0 or stock < 0:
+            errors.append(RowError(line, name, "Price and stock cannot be negative"))
+            continue
+
+        category_id = categories.get((record.get("category") or "").strip())
+        if category_id is None:
+            errors.append(RowError(line, name, f"Unknown category '{record.get('category')}'"))
+            continue
+
+        image = (record.get("image") or "").strip()
+        if image and not allowed_file(image):
+            errors.append(RowError(line, name, f"Invalid image type '{image}'"))
+            continue
+
+        seen.add(name)
+        description = (record.get("description") or "").strip() or None
+        rows.append(ImportRow(line, name, price, category_id, description, stock, image, None, None))
+    return rows
+
+
+def _upload(data, filename):
+    image_url = get_storage().save(io.BytesIO(data), filename)
+    return image_url, perceptual_hash(io.BytesIO(data)), build_variants(image_url, io.BytesIO(data))
+
+
+def _upload_images(rows, archive, errors):
+    # {name: (image_url, image_variants)}. Images are read from the zip in this thread (ZipFile is not
+    # thread safe) and at most IMPORT_UPLOAD_WORKERS * 2 are in flight at once.
+    # Images already in the StoredImage registry, or used by several rows, are
+    # uploaded at most once.
+    urls = {}
+    names = set(archive.namelist()) if archive else set()
+
+    hashes = {}
+    for row in rows:
+        if not row.image:
+            continue
+        if row.image not in names:
+            errors.append(RowError(row.line, row.name, f"Image '{row.image}' is not in the zip"))
+            continue
+        hashes[row.name] = hashlib.sha256(archive.read(row.image)).hexdigest()
+
+    known = {}
+    if hashes:
+        for stored in StoredImage.query.filter(StoredImage.sha256.in_(set(hashes.values()))):
+            if stored.image_variants is None:
+                # First time this image is used for a sticker (it was a custom request before)
+                stored.image_variants = build_variants(stored.image_url)
+            known[stored.sha256] = (stored.image_url, stored.image_variants)
+
+    pending, stored, failures = {}, [], {}
+    uploaded = set()
+
+    def collect(done):
+        for future in done:
+            sha256 = pending.pop(future)
+            try:
+                image_url, phash, image_variants = future.result()
+            except Exception as e:
+                failures[sha256] = f"Image upload failed: {e}"
+                continue
+            known[sha256] = (image_url, image_variants)
+            stored.append({
+                "sha256": sha256,
+                "phash": phash,
+                "image_url": image_url,
+                "image_variants": image_variants,
+                "created_at": utcnow(),
+            })
+
+    with ThreadPoolExecutor(max_workers=IMPORT_UPLOAD_WORKERS) as pool:
+        for row in rows:
+            sha256 = hashes.get(row.name)
+            if sha256 is None or sha256 in known or sha256 in uploaded:
+                continue
+            if len(pending) >= IMPORT_UPLOAD_WORKERS * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending[pool.submit(_upload, archive.read(row.image), row.image)] = sha256
+            uploaded.add(sha256)
+        collect(wait(pending)[0])
+
+    for row in rows:
+        sha256 = hashes.get(row.name)
+        if sha256 in known:
+            urls[row.name] = known[sha256]
+        elif sha256 in failures:
+            errors.append(RowError(row.line, row.name, failures[sha256]))
+
+    if stored:
+        stmt = dialect_insert(StoredImage)
+        if stmt is None:
+            db.session.execute(insert(StoredImage), stored)
+        else:
+            db.session.execute(stmt.values(stored).on_conflict_do_nothing(index_elements=["sha256"]))
+    return urls
+
+
+def _upsert(rows):
+    # One INSERT ... ON CONFLICT (name) DO UPDATE for the whole file. Stock is only
+    # set for new stickers; existing ones go through the inventory ledger.
+    values = [
+        {
+            "name": row.name,
+            "price": float(row.price),
+            "category_id": row.category_id,
+            "description": row.description,
+            "image_url": row.image_url,
+            "image_variants": row.image_variants,
+            "stock": row.stock,
+            "is_active": True,
+            "is_custom": False,
+            "updated_at": utcnow(),
+        }
+        for row in rows
+    ]
+    stmt = dialect_insert(Sticker)
+    if stmt is None:
+        for value in values:
+            sticker = Sticker.query.filter_by(name=value["name"]).first()
+            if sticker is None:
+                db.session.add(Sticker(**value))
+            else:
+                if sticker.image_url != value["image_url"]:
+                    sticker.image_variants = value["image_variants"]
+                for key in ("price", "category_id", "description", "image_url", "is_active"):
+                    setattr(sticker, key, value[key])
+        db.session.flush()
+        return
+
+    stmt = stmt.values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Sticker.name],
+        set_={
+            "price": stmt.excluded.price,
+            "category_id": stmt.excluded.category_id,
+            "description": stmt.excluded.description,
+            "image_url": stmt.excluded.image_url,
+            # The variants belong to the image: kept while it stays, replaced with it
+            "image_variants": case(
+                (Sticker.image_url == stmt.excluded.image_url, Sticker.image_variants),
+                else_=stmt.excluded.image_variants
+            ),
+            "is_active": True,
+            "updated_at": stmt.excluded.updated_at,
+        }
+    )
+    db.session.execute(stmt)
+
+
+def import_stickers(csv_file, zip_file=None):
+    # Creates or updates stickers from an uploaded CSV (+ zip of images) and returns an
+    # ImportReport. Rows with errors are skipped, the rest are imported in one go.
+    errors = []
+    categories = dict(db.session.query(Category.name, Category.id).all())
+    rows = _parse_rows(csv_file, categories, errors)
+
+    existing = {
+        name: (sticker_id, image_url)
+        for name, sticker_id, image_url in db.session.query(Sticker.name, Sticker.id, Sticker.image_url).filter(
+            Sticker.name.in_([row.name for row in rows])
+        )
+    } if rows else {}
+
+    missing_image = [row for row in rows if not row.image and row.name not in existing]
+    for row in missing_image:
+        errors.append(RowError(row.line, row.name, "An image is required for new stickers"))
+    rows = [row for row in rows if row not in missing_image]
+
+    archive = None
+    try:
+        archive = zipfile.ZipFile(zip_file) if zip_file else None
+    except zipfile.BadZipFile:
+        errors.append(RowError(0, "", "The images file is not a valid zip"))
+    urls = _upload_images(rows, archive, errors)
+
+    # Keep rows whose image uploaded, or that keep the image they already have
+    ready = []
+    for row in rows:
+        if row.image:
+            image_url, image_variants = urls.get(row.name, (None, None))
+        else:
+            # Unchanged image: _upsert keeps the sticker's variants
+            image_url, image_variants = existing[row.name][1], None
+        if image_url:
+            ready.append(row._replace(image_url=image_url, image_variants=image_variants))
+
+    if ready:
+        _upsert(ready)
+        for row in ready:
+            if row.name in existing:
+                adjust_stock(existing[row.name][0], row.stock, reason="import")
+
+        for sticker in Sticker.query.filter(Sticker.name.in_([row.name for row in ready])).all():
+            index_sticker(sticker, commit=False)
+        bump_catalog_version()
+        db.session.commit()
+
+    errors.sort(key=lambda error: error.line)
+    updated = sum(1 for row in ready if row.name in existing)
+    return ImportReport(len(ready) - updated, updated, errors)
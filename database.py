@@ -0,0 +1,114 @@
+import os
+import time
+from functools import wraps
+from flask import g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Select, TextClause, event
+from sqlalchemy.pool import NullPool
+
+
+# Each gunicorn worker process has its own pool, sized for its threads by default
+# (DB_POOL_SIZE ~ threads per worker; total connections ~ workers * (size + overflow)).
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", os.getenv("GUNICORN_THREADS", 5)))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 5))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 10))
+# Recycle before the server (or a load balancer) drops idle connections
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Behind PgBouncer in transaction mode PgBouncer does the pooling: connections are
+# not kept here, and server-side prepared statements are switched off. Session-level
+# features (pg_advisory_lock in flask bootstrap) need a direct DATABASE_URL.
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() == "true"
+
+# Read-only pages can be served from a replica (REPLICA_DATABASE_URL). After a
+# request that wrote, the same browser reads from the primary for this long so it
+# sees its own changes despite replication lag.
+REPLICA_DATABASE_URL = os.getenv("REPLICA_DATABASE_URL")
+REPLICA_STICKY_SECONDS = int(os.getenv("REPLICA_STICKY_SECONDS", 5))
+
+
+def engine_options(url):
+    if not url or url.startswith("sqlite"):
+        return {}
+    if DB_PGBOUNCER:
+        options = {"poolclass": NullPool}
+        if url.startswith("postgresql+psycopg:"):
+            # psycopg 3 prepares repeated statements by default
+            options["connect_args"] = {"prepare_threshold": None}
+        return options
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def configure_database(app, database_url):
+    app.config["SQLALCHEMY_DATABASE_URI"] = database_url
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_url)
+    if REPLICA_DATABASE_URL:
+        app.config["SQLALCHEMY_BINDS"] = {
+            "replica": {"url": REPLICA_DATABASE_URL, **engine_options(REPLICA_DATABASE_URL)}
+        }
+
+    @app.after_request
+    def stick_to_primary(response):
+        if g.get("db_wrote"):
+            session["primary_until"] = time.time() + REPLICA_STICKY_SECONDS
+        return response
+
+
+def replica_reads(f):
+    # For read-only views: their SELECTs go to the replica, unless this browser
+    # wrote something in the last REPLICA_STICKY_SECONDS
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if session.get("primary_until", 0) < time.time():
+            g.use_replica = True
+        return f(*args, **kwargs)
+    return wrapper
+
+
+def _is_read(clause):
+    if isinstance(clause, Select):
+        return clause._for_update_arg is None
+    # Raw SQL, e.g. the full-text search queries
+    return isinstance(clause, TextClause) and clause.text.lstrip().upper().startswith("SELECT")
+
+
+def _replica_requested():
+    return has_app_context() and g.get("use_replica") and not g.get("db_wrote")
+
+
+class RoutingSession(Session):
+    # Plain SELECTs in a replica_reads view go to the "replica" bind; writes, flushes,
+    # SELECT ... FOR UPDATE and everything after the first write use the primary
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and not self._flushing
+            and _is_read(clause)
+            and _replica_requested()
+        ):
+            engine = self._db.engines.get("replica")
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _wrote():
+    if has_request_context():
+        g.db_wrote = True
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _after_flush(session, flush_context):
+    _wrote()
+
+
+@event.listens_for(RoutingSession, "do_orm_execute")
+def _do_orm_execute(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        _wrote()
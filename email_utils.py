@@ -1,14 +1,167 @@
+import os
+import time
+from collections import deque
+from datetime import timedelta
 from flask_mail import Message
-from extensions import mail
-from threading import Thread
-from flask import copy_current_request_context
+from extensions import db, mail
+from models import EmailOutbox, utcnow
+
+
+# Delivery settings of the `flask send-emails` worker
+EMAIL_BATCH_SIZE = int(os.getenv("EMAIL_BATCH_SIZE", 50))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", 6))
+# Retry after 30s, 1m, 2m, 4m... capped at an hour
+EMAIL_RETRY_BASE = int(os.getenv("EMAIL_RETRY_BASE_SECONDS", 30))
+EMAIL_RETRY_MAX = 3600
+# Gmail and most providers throttle bursts, stay under their limit
+EMAIL_RATE_PER_MINUTE = int(os.getenv("EMAIL_RATE_PER_MINUTE", 60))
+# A claimed batch that isn't finished within this time (the worker died) is picked up
+# again by another worker. Keep it above batch size / rate per minute.
+EMAIL_LEASE_SECONDS = int(os.getenv("EMAIL_LEASE_SECONDS", 600))
+
+
+def _address(value):
+    # flask_mail accepts "a@b" or ("Name", "a@b"); tuples are stored as lists in JSON
+    return list(value) if isinstance(value, tuple) else value
+
+
+def _addresses(values):
+    return [_address(value) for value in values] if values else None
+
 
 def send_email(msg):
-    @copy_current_request_context
-    def send():
-        try:
-            mail.send(msg)
-        except Exception as e:
-            print("Mail sending error:", e)
-
-    Thread(target=send).start()
+    # Queues a flask_mail Message in the email_outbox table instead of sending it.
+    # Runs in the caller's transaction, so the mail only goes out if the caller
+    # commits (an order confirmation is never sent for a rolled back order).
+    db.session.add(EmailOutbox(
+        subject=msg.subject or "",
+        sender=_address(msg.sender),
+        recipients=_addresses(msg.recipients) or [],
+        cc=_addresses(msg.cc),
+        bcc=_addresses(msg.bcc),
+        reply_to=_address(msg.reply_to),
+        body=msg.body,
+        html=msg.html,
+    ))
+
+
+def _message(entry):
+    def address(value):
+        return tuple(value) if isinstance(value, list) else value
+
+    return Message(
+        subject=entry.subject,
+        sender=address(entry.sender),
+        recipients=[address(r) for r in entry.recipients],
+        cc=[address(r) for r in entry.cc or []],
+        bcc=[address(r) for r in entry.bcc or []],
+        reply_to=address(entry.reply_to),
+        body=entry.body,
+        html=entry.html,
+    )
+
+
+def _retry_later(entry, error):
+    entry.attempts += 1
+    entry.last_error = str(error)[:1000]
+    if entry.attempts >= EMAIL_MAX_ATTEMPTS:
+        entry.status = "failed"
+    else:
+        entry.status = "pending"
+        delay = min(EMAIL_RETRY_BASE * 2 ** (entry.attempts - 1), EMAIL_RETRY_MAX)
+        entry.next_attempt_at = utcnow() + timedelta(seconds=delay)
+
+
+class RateLimiter:
+    # At most `per_minute` sends in any 60 second window
+    def __init__(self, per_minute):
+        self.per_minute = per_minute
+        self.sent = deque()
+
+    def wait(self):
+        if self.per_minute <= 0:
+            return
+        now = time.monotonic()
+        while self.sent and now - self.sent[0] >= 60:
+            self.sent.popleft()
+        if len(self.sent) >= self.per_minute:
+            time.sleep(60 - (now - self.sent[0]))
+            self.sent.popleft()
+        self.sent.append(time.monotonic())
+
+
+def _claim(batch_size):
+    # Marks a batch of due messages as "sending" under a lease and commits, so no row
+    # lock or transaction is held while talking to the SMTP server. Rows whose lease
+    # ran out (their worker died mid-batch) are due again. Returns [(entry, Message)].
+    now = utcnow()
+    entries = EmailOutbox.query.filter(
+        EmailOutbox.status.in_(("pending", "sending")),
+        EmailOutbox.next_attempt_at <= now
+    ).order_by(EmailOutbox.next_attempt_at, EmailOutbox.id).limit(batch_size).with_for_update(skip_locked=True).all()
+    claimed = []
+    for entry in entries:
+        entry.status = "sending"
+        entry.next_attempt_at = now + timedelta(seconds=EMAIL_LEASE_SECONDS)
+        claimed.append((entry, _message(entry)))
+    db.session.commit()
+    return claimed
+
+
+def deliver_outbox(batch_size=EMAIL_BATCH_SIZE, limiter=None):
+    # Sends one batch of due messages over a single SMTP connection and returns
+    # (sent, failed). The batch is claimed first (SKIP LOCKED on Postgres), so several
+    # workers can drain the outbox without sending a message twice; each message's
+    # outcome is committed right after it is sent.
+    limiter = limiter or RateLimiter(EMAIL_RATE_PER_MINUTE)
+    claimed = _claim(batch_size)
+    if not claimed:
+        return 0, 0
+
+    sent = failed = tried = 0
+    try:
+        with mail.connect() as connection:
+            for entry, message in claimed:
+                limiter.wait()
+                tried += 1
+                try:
+                    connection.send(message)
+                except Exception as e:
+                    _retry_later(entry, e)
+                    db.session.commit()
+                    failed += 1
+                    # A dropped connection would fail the rest too, they are released below
+                    if connection.host is None or connection.host.sock is None:
+                        break
+                else:
+                    entry.status = "sent"
+                    entry.sent_at = utcnow()
+                    db.session.commit()
+                    sent += 1
+    except Exception as e:
+        # Could not connect at all, back off the whole batch
+        if not tried:
+            for entry, message in claimed:
+                _retry_later(entry, e)
+                failed += 1
+            tried = len(claimed)
+
+    # Untried messages are due again right away
+    for entry, message in claimed[tried:]:
+        entry.status = "pending"
+        entry.next_attempt_at = utcnow()
+    db.session.commit()
+    return sent, failed
+
+
+def run_outbox_worker(interval=5, batch_size=EMAIL_BATCH_SIZE):
+    # Drains the outbox; with an interval it keeps polling, otherwise it stops when empty
+    limiter = RateLimiter(EMAIL_RATE_PER_MINUTE)
+    while True:
+        sent, failed = deliver_outbox(batch_size, limiter)
+        if sent or failed:
+            print(f"Sent {sent} emails, {failed} failed")
+            continue
+        if not interval:
+            break
+        time.sleep(interval)
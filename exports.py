@@ -0,0 +1,91 @@
+import csv
+import io
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import select, union_all
+from models import Order, OrderItem, Payment, Sticker, ArchivedOrder, ArchivedOrderItem, ArchivedPayment
+from extensions import db
+
+
+EXPORT_FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+# Rows fetched per round trip; with stream_results the driver keeps only this many in memory
+EXPORT_BATCH_SIZE = 1000
+
+# (name, table, column); table is the order, item or payment model of the export
+EXPORT_COLUMNS = [
+    ("order_id", "order", "id"),
+    ("created_at", "order", "created_at"),
+    ("status", "order", "status"),
+    ("user_id", "order", "user_id"),
+    ("order_total", "order", "total_price"),
+    ("payment_method", "payment", "payment_method"),
+    ("full_name", "payment", "full_name"),
+    ("email", "payment", "email"),
+    ("pickup_date", "payment", "date"),
+    ("pickup_time", "payment", "time"),
+    ("item_id", "item", "id"),
+    ("sticker_id", "item", "sticker_id"),
+    ("sticker_name", "sticker", "name"),
+    ("quantity", "item", "quantity"),
+    ("price_at_time", "item", "price_at_time"),
+]
+
+
+def _value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def _select(order, item, payment, conditions):
+    # Orders without lines or payment still get one row, hence the outer joins
+    models = {"order": order, "item": item, "payment": payment, "sticker": Sticker}
+    return (
+        select(*[getattr(models[table], column).label(name) for name, table, column in EXPORT_COLUMNS])
+        .select_from(order)
+        .outerjoin(payment, payment.order_id == order.id)
+        .outerjoin(item, item.order_id == order.id)
+        .outerjoin(Sticker, Sticker.id == item.sticker_id)
+        .where(*conditions)
+    )
+
+
+def _rows(conditions, archived_conditions=None):
+    stmt = _select(Order, OrderItem, Payment, conditions)
+    if archived_conditions is not None:
+        stmt = union_all(stmt, _select(ArchivedOrder, ArchivedOrderItem, ArchivedPayment, archived_conditions))
+    stmt = stmt.order_by("created_at", "order_id", "item_id").execution_options(
+        yield_per=EXPORT_BATCH_SIZE
+    )
+    for partition in db.session.execute(stmt).partitions():
+        yield partition
+
+
+def export_order_lines(conditions, fmt="csv", archived_conditions=None):
+    # Generator for a streaming response: yields one chunk of text per batch of rows,
+    # so memory use doesn't depend on how many orders are exported. With
+    # archived_conditions the matching archived orders are included.
+    names = [name for name, _, _ in EXPORT_COLUMNS]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    if fmt == "csv":
+        writer.writerow(names)
+
+    for partition in _rows(conditions, archived_conditions):
+        for row in partition:
+            values = [_value(value) for value in row]
+            if fmt == "csv":
+                writer.writerow(values)
+            else:
+                buffer.write(json.dumps(dict(zip(names, values))) + "\n")
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
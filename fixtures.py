@@ -0,0 +1,238 @@
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+from sqlalchemy import case, func, insert, null
+from werkzeug.security import generate_password_hash
+from models import User, Category, Sticker, Order, OrderItem, Payment, utcnow
+from utils import dialect_insert
+from catalog_cache import bump_catalog_version
+from search import index_sticker, rebuild_search_index
+from analytics import backfill_analytics
+from extensions import db
+
+
+# --- Fixtures: categories and stickers from STICKERS_DATA or a JSON file ----------
+
+def read_fixture_file(path):
+    # A JSON list in the STICKERS_DATA format:
+    # [{"name": ..., "price": "0.49", "category_name": ..., "description": ..., "image_url": ..., "stock": 0}]
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    for entry in data:
+        entry["price"] = Decimal(str(entry.get("price", "0")))
+    return data
+
+
+def _upsert_categories(names):
+    # {name: id}; missing categories are inserted in one statement
+    names = sorted(set(names))
+    stmt = dialect_insert(Category)
+    if stmt is None:
+        existing = {name for (name,) in db.session.query(Category.name).filter(Category.name.in_(names))}
+        db.session.add_all(Category(name=name) for name in names if name not in existing)
+        db.session.flush()
+    elif names:
+        db.session.execute(stmt.values([{"name": name} for name in names]).on_conflict_do_nothing(index_elements=["name"]))
+    return dict(db.session.query(Category.name, Category.id).filter(Category.name.in_(names)).all())
+
+
+def load_stickers(data, update=False):
+    # Set-based load of sticker fixtures: one upsert for the categories and one for the
+    # stickers, matched by name. Existing stickers are left alone unless update=True
+    # (stock is never overwritten, it belongs to the inventory ledger).
+    # Returns the number of rows inserted or updated.
+    if not data:
+        return 0
+
+    categories = _upsert_categories(entry["category_name"] for entry in data)
+    now = utcnow()
+    rows = [
+        {
+            "name": entry["name"],
+            "price": float(entry["price"]),
+            "category_id": categories[entry["category_name"]],
+            "description": entry.get("description"),
+            "image_url": entry["image_url"],
+            "stock": entry.get("stock", 0),
+            "is_active": True,
+            "is_custom": False,
+            "updated_at": now,
+        }
+        for entry in data
+    ]
+
+    stmt = dialect_insert(Sticker)
+    if stmt is None:
+        existing = {name for (name,) in db.session.query(Sticker.name).filter(Sticker.name.in_([r["name"] for r in rows]))}
+        new_rows = [row for row in rows if row["name"] not in existing]
+        if new_rows:
+            db.session.execute(insert(Sticker), new_rows)
+        changed = len(new_rows)
+    else:
+        stmt = stmt.values(rows)
+        if update:
+            stmt = stmt.on_conflict_do_update(index_elements=["name"], set_={
+                "price": stmt.excluded.price,
+                "category_id": stmt.excluded.category_id,
+                "description": stmt.excluded.description,
+                "image_url": stmt.excluded.image_url,
+                # Variants of a replaced image are dropped; `flask build-image-variants` rebuilds them
+                "image_variants": case(
+                    (Sticker.image_url == stmt.excluded.image_url, Sticker.image_variants), else_=null()
+                ),
+                "updated_at": stmt.excluded.updated_at,
+            })
+        else:
+            stmt = stmt.on_conflict_do_nothing(index_elements=["name"])
+        changed = db.session.execute(stmt).rowcount
+
+    if changed:
+        for sticker in Sticker.query.filter(Sticker.name.in_([row["name"] for row in rows])).all():
+            index_sticker(sticker, commit=False)
+        bump_catalog_version()
+    db.session.commit()
+    return changed
+
+
+# --- Synthetic data for load testing ---------------------------------------------
+
+# Share of orders per status, roughly what production looks like
+STATUS_WEIGHTS = {"finished": 60, "confirmed": 15, "pending": 15, "cancelled": 10}
+# Lines per order: most orders have one or two stickers
+LINES_WEIGHTS = [40, 25, 15, 8, 5, 3, 2, 2]
+QUANTITY_WEIGHTS = [75, 15, 6, 2, 2]
+
+
+def _zipf_weights(n, s=1.1):
+    # Popularity by rank: a few stickers and users account for most orders
+    return list(accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def _batches(total, batch_size):
+    for start in range(0, total, batch_size):
+        yield start, min(batch_size, total - start)
+
+
+def _progress(label, done, total, started):
+    print(f"  {label}: {done}/{total} ({time.monotonic() - started:.1f}s)")
+
+
+def generate_users(count, batch_size, rng):
+    # All synthetic users share one password hash ("password"); hashing is the slow part
+    password = generate_password_hash("password")
+    offset = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+    started = time.monotonic()
+    for start, size in _batches(count, batch_size):
+        db.session.execute(insert(User), [
+            {
+                "username": f"load{offset + start + i}",
+                "email": f"load{offset + start + i}@example.test",
+                "password": password,
+                "is_admin": False,
+            }
+            for i in range(size)
+        ])
+        db.session.commit()
+        _progress("users", start + size, count, started)
+
+
+def generate_stickers(count, batch_size, rng):
+    category_ids = [category_id for (category_id,) in db.session.query(Category.id)]
+    if not category_ids:
+        raise ValueError("Create the categories first (flask bootstrap)")
+    images = [image for (image,) in db.session.query(Sticker.image_url).filter(Sticker.is_custom == False).distinct().limit(50)]
+    images = images or ["Logo.webp"]
+    offset = (db.session.query(func.max(Sticker.id)).scalar() or 0) + 1
+    started = time.monotonic()
+    for start, size in _batches(count, batch_size):
+        now = utcnow()
+        db.session.execute(insert(Sticker), [
+            {
+                "name": f"Load sticker {offset + start + i}",
+                "price": rng.choice([0.49, 0.99, 1.49, 1.99, 2.99]),
+                "category_id": rng.choice(category_ids),
+                "description": "Synthetic sticker for load testing",
+                "image_url": rng.choice(images),
+                "stock": rng.randint(0, 500),
+                "is_active": True,
+                "is_custom": False,
+                "updated_at": now,
+            }
+            for i in range(size)
+        ])
+        db.session.commit()
+        _progress("stickers", start + size, count, started)
+
+
+def generate_orders(count, batch_size, rng, days=365):
+    # Orders spread over the last `days` days. Users and stickers are picked with a
+    # Zipf distribution, so some customers and stickers are much busier than others.
+    user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+    stickers = db.session.query(Sticker.id, Sticker.price).filter(Sticker.is_active == True).all()
+    if not user_ids or not stickers:
+        raise ValueError("Generate users and stickers before orders")
+
+    rng.shuffle(user_ids)
+    rng.shuffle(stickers)
+    user_weights = _zipf_weights(len(user_ids))
+    sticker_weights = _zipf_weights(len(stickers))
+    statuses, status_weights = zip(*STATUS_WEIGHTS.items())
+    now = datetime.now()
+    started = time.monotonic()
+
+    for start, size in _batches(count, batch_size):
+        orders, lines = [], []
+        for _ in range(size):
+            wanted = min(rng.choices(range(1, len(LINES_WEIGHTS) + 1), LINES_WEIGHTS)[0], len(stickers))
+            picked = {}
+            while len(picked) < wanted:
+                sticker_id, price = rng.choices(stickers, cum_weights=sticker_weights)[0]
+                picked[sticker_id] = (Decimal(str(price or 0)), rng.choices(range(1, 6), QUANTITY_WEIGHTS)[0])
+            lines.append(picked)
+            orders.append({
+                "user_id": rng.choices(user_ids, cum_weights=user_weights)[0],
+                "created_at": now - timedelta(seconds=rng.randint(0, days * 86400)),
+                "status": rng.choices(statuses, status_weights)[0],
+                "total_price": sum(price * quantity for price, quantity in picked.values()),
+            })
+
+        # executemany with RETURNING, in parameter order, so lines can point at their order
+        order_ids = db.session.execute(
+            insert(Order).returning(Order.id, sort_by_parameter_order=True), orders
+        ).scalars().all()
+
+        db.session.execute(insert(OrderItem), [
+            {"order_id": order_id, "sticker_id": sticker_id, "price_at_time": price, "quantity": quantity}
+            for order_id, picked in zip(order_ids, lines)
+            for sticker_id, (price, quantity) in picked.items()
+        ])
+        db.session.execute(insert(Payment), [
+            {
+                "order_id": order_id,
+                "payment_method": rng.choice(["ideal", "card", "cash"]),
+                "full_name": f"Load customer {order['user_id']}",
+                "email": f"load{order['user_id']}@example.test",
+                "created_at": order["created_at"],
+            }
+            for order_id, order in zip(order_ids, orders)
+        ])
+        db.session.commit()
+        _progress("orders", start + size, count, started)
+
+
+def generate_synthetic(users=0, stickers=0, orders=0, batch_size=5000, seed=None):
+    rng = random.Random(seed)
+    if users:
+        generate_users(users, batch_size, rng)
+    if stickers:
+        generate_stickers(stickers, batch_size, rng)
+        bump_catalog_version()
+        db.session.commit()
+        rebuild_search_index()
+    if orders:
+        generate_orders(orders, batch_size, rng)
+        # Dashboards read the rollups, rebuild them in one pass
+        backfill_analytics()
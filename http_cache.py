@@ -0,0 +1,45 @@
+import hashlib
+import os
+from flask import current_app, make_response, request, session
+from flask_babel import get_locale
+from werkzeug.http import is_resource_modified
+from utils import current_cart_item_count
+
+
+# How long a CDN in front of the app may reuse an anonymous page without revalidating
+CDN_MAX_AGE = int(os.getenv("CDN_MAX_AGE", 60))
+
+
+def cached_page(etag_parts, render, last_modified=None):
+    # Conditional GET: answer 304 without rendering when the client's copy is still valid.
+    # etag_parts should identify the data on the page (catalog version, sticker updated_at...).
+
+    # Flashed messages are one-off content, and POSTs are never cached
+    if request.method != "GET" or session.get("_flashes"):
+        return render()
+
+    user_id = session.get("user_id")
+    # The navbar shows the user's name and the cart badge (guests can have a cookie cart)
+    cart_count = current_cart_item_count()
+    parts = list(etag_parts) + [str(get_locale()), request.full_path, user_id or "anonymous", cart_count]
+    etag = hashlib.sha1("|".join(str(p) for p in parts).encode()).hexdigest()
+
+    if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = make_response(render())
+    else:
+        response = current_app.response_class(status=304)
+
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # Locale and login both live in the session cookie
+    response.vary.add("Cookie")
+
+    if user_id or cart_count:
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    else:
+        response.cache_control.public = True
+        response.cache_control.max_age = 0
+        response.cache_control.s_maxage = CDN_MAX_AGE
+    return response
@@ -0,0 +1,133 @@
+import hashlib
+import os
+from flask import url_for
+from markupsafe import Markup, escape
+from PIL import Image, features
+from utils import UPLOAD_FOLDER
+
+
+# Widths of the resized copies of every sticker image. AVIF is smaller again but
+# slower to encode, add it with IMAGE_VARIANT_FORMATS=webp,avif.
+VARIANT_WIDTHS = (200, 400, 800)
+VARIANT_FORMATS = [
+    fmt for fmt in os.getenv("IMAGE_VARIANT_FORMATS", "webp").split(",")
+    if fmt in ("webp", "avif") and features.check(fmt)
+]
+VARIANT_DIR = "variants"
+
+# Grid cards are a third of the row on desktop, full width on phones
+DEFAULT_SIZES = "(min-width: 768px) 33vw, 100vw"
+
+
+def _widths(width):
+    # Never upscale; images narrower than the smallest width get one copy at their own size
+    widths = [w for w in VARIANT_WIDTHS if width is None or w <= width]
+    return widths or [width]
+
+
+def _cloudinary_url(image_url, width, fmt):
+    # Cloudinary resizes and converts on the fly from a transformation in the URL
+    return image_url.replace("/image/upload/", f"/image/upload/w_{width},c_limit,f_{fmt},q_auto/", 1)
+
+
+def _local_variants(filename):
+    source = os.path.join(UPLOAD_FOLDER, filename)
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    os.makedirs(os.path.join(UPLOAD_FOLDER, VARIANT_DIR), exist_ok=True)
+
+    with Image.open(source) as image:
+        image.load()
+        width, height = image.size
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+
+        variants = {"width": width, "height": height}
+        for fmt in VARIANT_FORMATS:
+            variants[fmt] = []
+            for w in _widths(width):
+                name = f"{VARIANT_DIR}/{stem}-{w}.{fmt}"
+                resized = image.resize((w, round(height * w / width)), Image.LANCZOS) if w != width else image
+                resized.save(os.path.join(UPLOAD_FOLDER, name), fmt.upper(), quality=80)
+                variants[fmt].append([w, name])
+    return variants
+
+
+def build_variants(image_url, source_path=None):
+    # Returns the image_variants dict for a sticker image, or None when the image
+    # can't be resized. source_path is a local copy of the image (the upload spool
+    # file), used to read the dimensions of remote images.
+    #   {"width": 1000, "height": 800, "webp": [[200, url], [400, url], ...], "avif": [...]}
+    if not image_url:
+        return None
+
+    if not image_url.startswith("http"):
+        return _local_variants(image_url)
+
+    if "/image/upload/" not in image_url:
+        return None
+    width = height = None
+    if source_path:
+        with Image.open(source_path) as image:
+            width, height = image.size
+    variants = {"width": width, "height": height}
+    for fmt in VARIANT_FORMATS:
+        variants[fmt] = [[w, _cloudinary_url(image_url, w, fmt)] for w in _widths(width)]
+    return variants
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def perceptual_hash(path):
+    # Difference hash: shrink to 9x8 grey pixels and record whether each pixel is
+    # brighter than its right neighbour. Re-encoded or resized copies of an image
+    # end up within a few bits of each other.
+    with Image.open(path) as image:
+        pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def hash_distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def image_src(image_url):
+    # Stickers store either a full URL or a file name in static/images/stickers
+    if image_url and image_url.startswith("http"):
+        return image_url
+    return url_for("static", filename="images/stickers/" + (image_url or ""))
+
+
+def sticker_image(sticker, sizes=DEFAULT_SIZES, lazy=True, **attrs):
+    # Template helper: <picture> with srcset per format, falling back to the original
+    # image for stickers without variants.  {{ sticker_image(sticker, class="img-fluid") }}
+    variants = getattr(sticker, "image_variants", None) or {}
+    attrs.setdefault("alt", sticker.name)
+    if variants.get("width") and variants.get("height"):
+        attrs["width"] = variants["width"]
+        attrs["height"] = variants["height"]
+    if lazy:
+        attrs["loading"] = "lazy"
+    attrs["decoding"] = "async"
+
+    sources = []
+    for fmt in ("avif", "webp"):
+        if variants.get(fmt):
+            srcset = ", ".join(f"{image_src(url)} {w}w" for w, url in variants[fmt])
+            sources.append(f'<source type="image/{fmt}" srcset="{escape(srcset)}" sizes="{escape(sizes)}">')
+
+    img_attrs = " ".join(f'{name}="{escape(value)}"' for name, value in attrs.items())
+    img = f'<img src="{escape(image_src(sticker.image_url))}" {img_attrs}>'
+    if not sources:
+        return Markup(img)
+    # display: contents keeps the <img> sized by the card as before
+    return Markup('<picture style="display: contents">' + "".join(sources) + img + "</picture>")
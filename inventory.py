@@ -0,0 +1,334 @@
+import os
+import random
+from collections import namedtuple
+from datetime import timedelta
+from sqlalchemy import case, func, insert, select, tuple_, update
+from sqlalchemy.orm import aliased
+from models import Sticker, OrderItem, StockReservation, StockShard, InventoryMovement, utcnow
+from utils import dialect_insert
+from extensions import db
+
+
+# How long stock stays held for a cart that reached the checkout page
+RESERVATION_TTL = timedelta(minutes=int(os.getenv("RESERVATION_TTL_MINUTES", 15)))
+
+# Live stock of every sticker is spread over this many StockShard rows
+STOCK_SHARDS = int(os.getenv("STOCK_SHARDS", 8))
+
+# Random shard picks per checkout before falling back to locking all shards of a sticker
+SHARD_ATTEMPTS = 3
+
+Shortage = namedtuple("Shortage", "sticker_id name requested available")
+
+
+def order_quantities(order_id):
+    # {sticker_id: quantity} for an order, in one query
+    rows = db.session.query(OrderItem.sticker_id, OrderItem.quantity).filter(
+        OrderItem.order_id == order_id
+    ).all()
+    quantities = {}
+    for sticker_id, quantity in rows:
+        quantities[sticker_id] = quantities.get(sticker_id, 0) + (quantity or 0)
+    return quantities
+
+
+# --- Stock levels ---------------------------------------------------------------
+
+def _held(sticker_id_column, exclude_order_id=None):
+    # Unexpired holds on a sticker, served by the (sticker_id, expires_at) index.
+    # Holds of exclude_order_id are not counted, so an order never competes with itself.
+    held = select(func.coalesce(func.sum(StockReservation.quantity), 0)).where(
+        StockReservation.sticker_id == sticker_id_column,
+        StockReservation.expires_at > utcnow()
+    )
+    if exclude_order_id is not None:
+        held = held.where(StockReservation.order_id != exclude_order_id)
+    return held.scalar_subquery()
+
+
+def _sharded(sticker_id_column):
+    shard = aliased(StockShard)
+    return select(func.sum(shard.remaining)).where(shard.sticker_id == sticker_id_column).scalar_subquery()
+
+
+def on_hand_expr():
+    # Sum of the shards; stickers that were never sharded still use Sticker.stock
+    return func.coalesce(_sharded(Sticker.id), Sticker.stock, 0)
+
+
+def available_stock_expr(exclude_order_id=None):
+    return on_hand_expr() - _held(Sticker.id, exclude_order_id)
+
+
+def on_hand_stock(sticker_ids):
+    # {sticker_id: on hand} in one query
+    return dict(db.session.query(Sticker.id, on_hand_expr()).filter(Sticker.id.in_(sticker_ids)).all())
+
+
+def available_stock(sticker_ids, exclude_order_id=None):
+    # {sticker_id: available} in one query
+    rows = db.session.query(Sticker.id, available_stock_expr(exclude_order_id)).filter(
+        Sticker.id.in_(sticker_ids)
+    ).all()
+    return dict(rows)
+
+
+# --- Reservations ---------------------------------------------------------------
+
+def reserve_stock(order_id, quantities):
+    # Replaces the order's holds with new ones that expire after RESERVATION_TTL.
+    # Returns the shortages; when there are any, nothing is held. The caller commits.
+    ids = sorted(quantities)
+
+    # Lock the sticker rows in id order so concurrent reservations queue up
+    rows = db.session.query(Sticker.id, Sticker.name, available_stock_expr(order_id)).filter(
+        Sticker.id.in_(ids)
+    ).order_by(Sticker.id).with_for_update(of=Sticker).all()
+
+    StockReservation.query.filter_by(order_id=order_id).delete(synchronize_session=False)
+
+    shortages = [
+        Shortage(sticker_id, name, quantities[sticker_id], max(available, 0))
+        for sticker_id, name, available in rows
+        if available < quantities[sticker_id]
+    ]
+    if shortages or not rows:
+        return shortages
+
+    expires_at = utcnow() + RESERVATION_TTL
+    db.session.execute(insert(StockReservation), [
+        {"order_id": order_id, "sticker_id": sticker_id, "quantity": quantities[sticker_id], "expires_at": expires_at}
+        for sticker_id, _, _ in rows
+    ])
+    return []
+
+
+def release_reservations(order_id):
+    StockReservation.query.filter_by(order_id=order_id).delete(synchronize_session=False)
+
+
+def release_expired_reservations():
+    # Bulk delete of expired holds. Reads already ignore them, this only keeps the table small.
+    deleted = StockReservation.query.filter(
+        StockReservation.expires_at <= utcnow()
+    ).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
+
+
+# --- Shards and the movement ledger ---------------------------------------------
+
+def _split(amount, parts):
+    base, extra = divmod(amount, parts)
+    return [base + (1 if n < extra else 0) for n in range(parts)]
+
+
+def ensure_shards(sticker_ids):
+    # Creates the shards of stickers that don't have them yet, from Sticker.stock.
+    # ON CONFLICT DO NOTHING lets two workers race on this safely.
+    existing = {
+        sticker_id for (sticker_id,) in
+        db.session.query(StockShard.sticker_id).filter(StockShard.sticker_id.in_(sticker_ids)).distinct()
+    }
+    missing = [sticker_id for sticker_id in sticker_ids if sticker_id not in existing]
+    if not missing:
+        return
+
+    rows = []
+    for sticker_id, stock in db.session.query(Sticker.id, Sticker.stock).filter(Sticker.id.in_(missing)):
+        for shard, remaining in enumerate(_split(max(stock or 0, 0), STOCK_SHARDS)):
+            rows.append({"sticker_id": sticker_id, "shard": shard, "remaining": remaining})
+    if not rows:
+        return
+
+    stmt = dialect_insert(StockShard)
+    if stmt is None:
+        db.session.execute(insert(StockShard), rows)
+    else:
+        db.session.execute(stmt.on_conflict_do_nothing(index_elements=["sticker_id", "shard"]), rows)
+
+
+def _take_from_shards(choice, quantities, order_id):
+    # One UPDATE over the chosen (sticker_id, shard) pairs. A row is only taken from when
+    # the shard has enough left and the sticker still has enough that isn't held by
+    # other orders. Returns the (sticker_id, shard) pairs that were decremented.
+    wanted = case({sticker_id: quantities[sticker_id] for sticker_id in choice}, value=StockShard.sticker_id)
+    available = _sharded(StockShard.sticker_id) - _held(StockShard.sticker_id, order_id)
+    stmt = (
+        update(StockShard)
+        .where(
+            tuple_(StockShard.sticker_id, StockShard.shard).in_(list(choice.items())),
+            StockShard.remaining >= wanted,
+            available >= wanted
+        )
+        .values(remaining=StockShard.remaining - wanted)
+        .returning(StockShard.sticker_id, StockShard.shard)
+        .execution_options(synchronize_session=False)
+    )
+    return db.session.execute(stmt).all()
+
+
+def _pick_shards(quantities):
+    # A random shard per sticker among the ones that can cover the quantity alone
+    wanted = case(quantities, value=StockShard.sticker_id)
+    candidates = {}
+    for sticker_id, shard in db.session.query(StockShard.sticker_id, StockShard.shard).filter(
+        StockShard.sticker_id.in_(quantities), StockShard.remaining >= wanted
+    ):
+        candidates.setdefault(sticker_id, []).append(shard)
+    return {sticker_id: random.choice(shards) for sticker_id, shards in candidates.items()}
+
+
+def _drain_shards(sticker_id, quantity, order_id):
+    # Slow path when no single shard has enough: lock all shards of the sticker and take
+    # from several. Returns [(shard, taken)], or None when there isn't enough stock.
+    shards = StockShard.query.filter_by(sticker_id=sticker_id).order_by(StockShard.shard).with_for_update().all()
+    held = db.session.query(_held(sticker_id, order_id)).scalar()
+    if sum(s.remaining for s in shards) - held < quantity:
+        return None
+
+    taken = []
+    for shard in sorted(shards, key=lambda s: s.remaining, reverse=True):
+        amount = min(shard.remaining, quantity)
+        if amount:
+            shard.remaining -= amount
+            quantity -= amount
+            taken.append((shard.shard, amount))
+        if not quantity:
+            break
+    db.session.flush()
+    return taken
+
+
+def _record_movements(movements, reason, order_id=None):
+    # movements: [(sticker_id, shard, delta)]
+    if movements:
+        db.session.execute(insert(InventoryMovement), [
+            {
+                "sticker_id": sticker_id,
+                "shard": shard,
+                "delta": delta,
+                "reason": reason,
+                "order_id": order_id,
+                "compacted": False,
+                "created_at": utcnow(),
+            }
+            for sticker_id, shard, delta in movements
+        ])
+
+
+def _shortages(quantities, order_id):
+    rows = db.session.query(Sticker.id, Sticker.name, available_stock_expr(order_id)).filter(
+        Sticker.id.in_(quantities)
+    ).all()
+    return [
+        Shortage(sticker_id, name, quantities[sticker_id], max(available, 0))
+        for sticker_id, name, available in rows
+    ]
+
+
+def decrement_stock(quantities, order_id=None):
+    # Takes {sticker_id: quantity} out of stock for a checkout. Each sticker is taken
+    # from a random shard that can cover it, all stickers in one conditional UPDATE.
+    # Shards can never go below zero, so nothing is oversold. Every decrement is
+    # appended to the inventory_movement ledger and the order's own holds are
+    # converted (deleted). Returns the shortages; when there are any, the caller must
+    # roll back because the other stickers were already decremented.
+    if not quantities:
+        return []
+
+    # Lock the sticker rows in id order, like reserve_stock. The check against other
+    # orders' holds sums every shard, so it is only safe while no other checkout can
+    # take from a different shard of the same sticker.
+    db.session.query(Sticker.id).filter(Sticker.id.in_(quantities)).order_by(Sticker.id).with_for_update().all()
+    ensure_shards(list(quantities))
+    pending = dict(quantities)
+    movements = []
+
+    for _ in range(SHARD_ATTEMPTS):
+        choice = _pick_shards(pending)
+        if choice:
+            for sticker_id, shard in _take_from_shards(choice, pending, order_id):
+                movements.append((sticker_id, shard, -pending.pop(sticker_id)))
+        if not pending:
+            break
+
+        # Whatever is left and isn't available at all is a real shortage
+        available = available_stock(list(pending), exclude_order_id=order_id)
+        short = {sticker_id: q for sticker_id, q in pending.items() if available.get(sticker_id, 0) < q}
+        if short:
+            return _shortages(short, order_id)
+        if not choice:
+            # No single shard can cover any of them, picking again won't help
+            break
+
+    # Enough stock overall, but spread so that no single shard can cover it
+    for sticker_id, quantity in list(pending.items()):
+        taken = _drain_shards(sticker_id, quantity, order_id)
+        if taken is None:
+            return _shortages({sticker_id: quantity}, order_id)
+        movements.extend((sticker_id, shard, -amount) for shard, amount in taken)
+
+    _record_movements(movements, "checkout", order_id)
+    if order_id is not None:
+        release_reservations(order_id)
+    return []
+
+
+def adjust_stock(sticker_id, new_on_hand, reason="adjustment"):
+    # Sets the on-hand stock of a sticker (admin edit) by writing a movement for the
+    # difference instead of overwriting Sticker.stock. Returns the delta.
+    ensure_shards([sticker_id])
+    shards = StockShard.query.filter_by(sticker_id=sticker_id).order_by(StockShard.shard).with_for_update().all()
+    delta = max(new_on_hand, 0) - sum(s.remaining for s in shards)
+    if not delta:
+        return 0
+
+    if delta > 0:
+        for shard, extra in zip(shards, _split(delta, len(shards))):
+            shard.remaining += extra
+    else:
+        to_take = -delta
+        for shard in sorted(shards, key=lambda s: s.remaining, reverse=True):
+            amount = min(shard.remaining, to_take)
+            shard.remaining -= amount
+            to_take -= amount
+
+    db.session.flush()
+    _record_movements([(sticker_id, None, delta)], reason)
+    return delta
+
+
+def compact_inventory():
+    # Folds uncompacted movements into Sticker.stock and evens out the shards of the
+    # stickers involved. The movements are marked with UPDATE .. RETURNING, so exactly
+    # the rows that get marked are the ones summed, even with checkouts running.
+    marked = db.session.execute(
+        update(InventoryMovement)
+        .where(InventoryMovement.compacted == False)
+        .values(compacted=True)
+        .returning(InventoryMovement.sticker_id, InventoryMovement.delta)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not marked:
+        db.session.commit()
+        return 0
+
+    totals = {}
+    for sticker_id, delta in marked:
+        totals[sticker_id] = totals.get(sticker_id, 0) + delta
+
+    db.session.execute(
+        update(Sticker)
+        .where(Sticker.id.in_(totals))
+        .values(stock=func.coalesce(Sticker.stock, 0) + case(totals, value=Sticker.id))
+        .execution_options(synchronize_session=False)
+    )
+
+    for sticker_id in sorted(totals):
+        shards = StockShard.query.filter_by(sticker_id=sticker_id).order_by(StockShard.shard).with_for_update().all()
+        for shard, remaining in zip(shards, _split(sum(s.remaining for s in shards), len(shards))):
+            shard.remaining = remaining
+
+    db.session.commit()
+    return len(marked)
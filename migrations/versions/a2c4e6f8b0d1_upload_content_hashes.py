@@ -0,0 +1,41 @@
+"""Add content hashes to image uploads and custom stickers
+
+Revision ID: a2c4e6f8b0d1
+Revises: f1b6d2e8a4c7
+Create Date: 2026-10-18 12:21:44.901573
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2c4e6f8b0d1'
+down_revision = 'f1b6d2e8a4c7'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, column):
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    # Tables made by `flask bootstrap` (create_all) may already have the columns
+    if not _has_column('custom_sticker', 'image_sha256'):
+        with op.batch_alter_table('custom_sticker', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('image_sha256', sa.String(length=64), nullable=True))
+            batch_op.create_index('ix_custom_sticker_image_sha256', ['image_sha256'], unique=False)
+
+    if not _has_column('image_upload', 'sha256'):
+        with op.batch_alter_table('image_upload', schema=None) as batch_op:
+            batch_op.add_column(sa.Column('sha256', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('image_upload', schema=None) as batch_op:
+        batch_op.drop_column('sha256')
+
+    with op.batch_alter_table('custom_sticker', schema=None) as batch_op:
+        batch_op.drop_index('ix_custom_sticker_image_sha256')
+        batch_op.drop_column('image_sha256')
@@ -0,0 +1,28 @@
+"""Add updated_at to Sticker
+
+Revision ID: b3f1c2d4e5a6
+Revises: 57ba335c8981
+Create Date: 2026-10-18 10:12:41.208311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f1c2d4e5a6'
+down_revision = '57ba335c8981'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sticker', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True))
+
+    op.execute("UPDATE sticker SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL")
+
+
+def downgrade():
+    with op.batch_alter_table('sticker', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
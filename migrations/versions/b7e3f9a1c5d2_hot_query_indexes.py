@@ -0,0 +1,42 @@
+"""Index the columns the hot queries filter on
+
+Revision ID: b7e3f9a1c5d2
+Revises: a2c4e6f8b0d1
+Create Date: 2026-10-18 13:05:12.418206
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3f9a1c5d2'
+down_revision = 'a2c4e6f8b0d1'
+branch_labels = None
+depends_on = None
+
+
+# (name, table, columns). order_item (order_id, sticker_id) and order (status,
+# created_at) are already covered by uq_order_item_order_sticker and
+# ix_order_status_created_at.
+INDEXES = [
+    ('ix_order_user_status', 'order', ['user_id', 'status']),
+    ('ix_order_created_at', 'order', ['created_at', 'id']),
+    ('ix_sticker_active_category', 'sticker', ['is_active', 'category_id']),
+    ('ix_custom_sticker_user_id', 'custom_sticker', ['user_id']),
+    ('ix_custom_sticker_created_at', 'custom_sticker', ['created_at', 'id']),
+    ('ix_payment_order_id', 'payment', ['order_id']),
+]
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY doesn't lock out writes on Postgres, but can't run
+    # inside a transaction. if_not_exists lets a half-finished run be retried.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,47 @@
+"""Backfill order.created_at and make it NOT NULL
+
+Revision ID: c3a9e5f7b2d4
+Revises: b7e3f9a1c5d2
+Create Date: 2026-10-18 14:02:51.630418
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a9e5f7b2d4'
+down_revision = 'b7e3f9a1c5d2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Old orders without a date get their payment's date, else the date of the next
+    # dated order (ids grow with time), else now. Keyset pagination and the archive
+    # sort on created_at, so it can't be NULL.
+    op.execute("""
+        UPDATE "order" SET created_at = COALESCE(
+            (SELECT MIN(p.created_at) FROM payment p WHERE p.order_id = "order".id),
+            (SELECT MIN(o2.created_at) FROM "order" o2 WHERE o2.id > "order".id AND o2.created_at IS NOT NULL),
+            CURRENT_TIMESTAMP
+        )
+        WHERE created_at IS NULL
+    """)
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+
+    # The archive table is created by `flask bootstrap`; only undated orders are never archived
+    if sa.inspect(op.get_bind()).has_table('order_archive'):
+        with op.batch_alter_table('order_archive', schema=None) as batch_op:
+            batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    if sa.inspect(op.get_bind()).has_table('order_archive'):
+        with op.batch_alter_table('order_archive', schema=None) as batch_op:
+            batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
+
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.alter_column('created_at', existing_type=sa.DateTime(), nullable=True)
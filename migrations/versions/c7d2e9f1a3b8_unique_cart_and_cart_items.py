@@ -0,0 +1,58 @@
+"""One cart per user and one line per sticker in an order
+
+Revision ID: c7d2e9f1a3b8
+Revises: b3f1c2d4e5a6
+Create Date: 2026-10-18 11:02:17.553910
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2e9f1a3b8'
+down_revision = 'b3f1c2d4e5a6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Merge duplicate lines into the oldest one before adding the constraint
+    op.execute("""
+        UPDATE order_item SET quantity = (
+            SELECT SUM(o2.quantity) FROM order_item o2
+            WHERE o2.order_id = order_item.order_id AND o2.sticker_id = order_item.sticker_id
+        )
+        WHERE id IN (
+            SELECT MIN(id) FROM order_item GROUP BY order_id, sticker_id HAVING COUNT(*) > 1
+        )
+    """)
+    op.execute("""
+        DELETE FROM order_item
+        WHERE id NOT IN (SELECT MIN(id) FROM order_item GROUP BY order_id, sticker_id)
+    """)
+
+    # Keep the newest cart per user, the one they were last adding to; older
+    # duplicates are marked abandoned
+    op.execute("""
+        UPDATE "order" SET status = 'abandoned'
+        WHERE status = 'cart' AND id NOT IN (
+            SELECT MAX(id) FROM "order" WHERE status = 'cart' GROUP BY user_id
+        )
+    """)
+
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.create_unique_constraint('uq_order_item_order_sticker', ['order_id', 'sticker_id'])
+
+    op.create_index(
+        'uq_order_one_cart_per_user', 'order', ['user_id'], unique=True,
+        postgresql_where=sa.text("status = 'cart'"),
+        sqlite_where=sa.text("status = 'cart'")
+    )
+
+
+def downgrade():
+    op.drop_index('uq_order_one_cart_per_user', table_name='order')
+
+    with op.batch_alter_table('order_item', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_order_item_order_sticker', type_='unique')
@@ -0,0 +1,25 @@
+"""Index orders on (status, created_at) for the admin orders list
+
+Revision ID: d4e8a1b2c3f5
+Revises: c7d2e9f1a3b8
+Create Date: 2026-10-18 11:24:05.517203
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e8a1b2c3f5'
+down_revision = 'c7d2e9f1a3b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.create_index('ix_order_status_created_at', ['status', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('order', schema=None) as batch_op:
+        batch_op.drop_index('ix_order_status_created_at')
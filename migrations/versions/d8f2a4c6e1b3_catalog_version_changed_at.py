@@ -0,0 +1,41 @@
+"""Record when the catalog version was last bumped
+
+Revision ID: d8f2a4c6e1b3
+Revises: c3a9e5f7b2d4
+Create Date: 2026-10-18 14:48:19.207733
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f2a4c6e1b3'
+down_revision = 'c3a9e5f7b2d4'
+branch_labels = None
+depends_on = None
+
+
+def _columns(table):
+    inspector = sa.inspect(op.get_bind())
+    if not inspector.has_table(table):
+        return None
+    return {column['name'] for column in inspector.get_columns(table)}
+
+
+def upgrade():
+    # catalog_version is created by `flask bootstrap`, which on a fresh database
+    # already includes the column
+    columns = _columns('catalog_version')
+    if columns is None or 'changed_at' in columns:
+        return
+    with op.batch_alter_table('catalog_version', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('changed_at', sa.DateTime(timezone=True), nullable=True))
+    # Start from now: earlier changes are unknown, and Last-Modified must not go back
+    op.execute("UPDATE catalog_version SET changed_at = CURRENT_TIMESTAMP")
+
+
+def downgrade():
+    if 'changed_at' in (_columns('catalog_version') or ()):
+        with op.batch_alter_table('catalog_version', schema=None) as batch_op:
+            batch_op.drop_column('changed_at')
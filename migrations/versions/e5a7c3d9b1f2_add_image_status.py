@@ -0,0 +1,32 @@
+"""Add image_status to sticker and custom_sticker
+
+Revision ID: e5a7c3d9b1f2
+Revises: d4e8a1b2c3f5
+Create Date: 2026-10-18 11:52:37.804126
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c3d9b1f2'
+down_revision = 'd4e8a1b2c3f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sticker', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_status', sa.String(length=20), nullable=True, server_default='ready'))
+
+    with op.batch_alter_table('custom_sticker', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_status', sa.String(length=20), nullable=True, server_default='ready'))
+
+
+def downgrade():
+    with op.batch_alter_table('custom_sticker', schema=None) as batch_op:
+        batch_op.drop_column('image_status')
+
+    with op.batch_alter_table('sticker', schema=None) as batch_op:
+        batch_op.drop_column('image_status')
@@ -0,0 +1,44 @@
+"""Create the image_upload queue table
+
+Revision ID: e9c4b7d2f6a1
+Revises: e5a7c3d9b1f2
+Create Date: 2026-10-18 11:53:10.262915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e9c4b7d2f6a1'
+down_revision = 'e5a7c3d9b1f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases set up with `flask bootstrap` (create_all) already have the table
+    if sa.inspect(op.get_bind()).has_table('image_upload'):
+        return
+
+    op.create_table(
+        'image_upload',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('path', sa.String(length=500), nullable=False),
+        sa.Column('filename', sa.String(length=255), nullable=False),
+        sa.Column('target', sa.String(length=20), nullable=False),
+        sa.Column('target_id', sa.Integer(), nullable=False),
+        sa.Column('activate', sa.Boolean(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('next_attempt_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_image_upload_status_next_attempt', 'image_upload', ['status', 'next_attempt_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_image_upload_status_next_attempt', table_name='image_upload')
+    op.drop_table('image_upload')
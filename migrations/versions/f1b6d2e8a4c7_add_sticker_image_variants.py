@@ -0,0 +1,26 @@
+"""Add image_variants to sticker
+
+Revision ID: f1b6d2e8a4c7
+Revises: e9c4b7d2f6a1
+Create Date: 2026-10-18 12:08:15.362940
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b6d2e8a4c7'
+down_revision = 'e9c4b7d2f6a1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('sticker', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('image_variants', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('sticker', schema=None) as batch_op:
+        batch_op.drop_column('image_variants')
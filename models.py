@@ -1,6 +1,12 @@
 from extensions import db
 from werkzeug.security import generate_password_hash, check_password_hash
 from decimal import Decimal
+from datetime import datetime, timezone
+
+
+def utcnow():
+    return datetime.now(timezone.utc)
+
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -18,6 +24,11 @@ class User(db.Model):
         return check_password_hash(self.password, password)
 
 class Sticker(db.Model):
+    # Shop and category pages list the active stickers of a category
+    __table_args__ = (
+        db.Index('ix_sticker_active_category', 'is_active', 'category_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), unique=True, nullable=False)
     price = db.Column(db.Float, nullable=True)
@@ -28,6 +39,11 @@ class Sticker(db.Model):
     is_active = db.Column(db.Boolean, default=True)
     is_custom = db.Column(db.Boolean, default=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    updated_at = db.Column(db.DateTime(timezone=True), default=utcnow, onupdate=utcnow, nullable=True)
+    # "pending" while a new image is still being uploaded (see uploads.py)
+    image_status = db.Column(db.String(20), nullable=True, default="ready")
+    # Resized WebP/AVIF copies of the image and its size, see images.build_variants
+    image_variants = db.Column(db.JSON, nullable=True)
 
     order_items = db.relationship('OrderItem', backref='sticker', lazy=True)
 
@@ -39,6 +55,13 @@ class Category(db.Model):
     stickers = db.relationship("Sticker", backref="category", lazy=True)
 
 class CustomSticker(db.Model):
+    __table_args__ = (
+        # A user's requests on the profile page
+        db.Index('ix_custom_sticker_user_id', 'user_id'),
+        # Admin suggestions list, newest first (keyset on created_at, id)
+        db.Index('ix_custom_sticker_created_at', 'created_at', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     sticker_id = db.Column(db.Integer, db.ForeignKey('sticker.id'), nullable=True)
@@ -48,21 +71,46 @@ class CustomSticker(db.Model):
     approval_status = db.Column(db.String(255), nullable=False)
     request_approval = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime)
+    image_status = db.Column(db.String(20), nullable=True, default="ready")
+    # SHA-256 of the uploaded file, to spot resubmitted images (see StoredImage)
+    image_sha256 = db.Column(db.String(64), nullable=True, index=True)
 
     user = db.relationship("User", backref="custom_stickers")
 
 
 class Order(db.Model):
+    # At most one open cart per user
+    __table_args__ = (
+        db.Index(
+            'uq_order_one_cart_per_user', 'user_id', unique=True,
+            postgresql_where=db.text("status = 'cart'"),
+            sqlite_where=db.text("status = 'cart'")
+        ),
+        # Admin orders list: filter by status, newest first
+        db.Index('ix_order_status_created_at', 'status', 'created_at'),
+        # ... and unfiltered, newest first
+        db.Index('ix_order_created_at', 'created_at', 'id'),
+        # A user's cart and order history
+        db.Index('ix_order_user_status', 'user_id', 'status'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    created_at = db.Column(db.DateTime, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False)
     total_price = db.Column(db.Numeric(10, 2), default=Decimal("0.00"), nullable=True)
     status = db.Column(db.String(255), nullable=True)
 
     order_items = db.relationship('OrderItem', backref='order', lazy=True, cascade='all, delete-orphan')
     payment = db.relationship('Payment', backref='order', uselist=False, cascade='all, delete-orphan')
 
+    # See ArchivedOrder
+    archived = False
+
 class OrderItem(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('order_id', 'sticker_id', name='uq_order_item_order_sticker'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     quantity = db.Column(db.Integer, unique=False, nullable=True)
     price_at_time = db.Column(db.Numeric(10, 2), nullable=True)
@@ -71,6 +119,10 @@ class OrderItem(db.Model):
 
 class Payment(db.Model):
     __tablename__ = "payment"
+    __table_args__ = (
+        db.Index('ix_payment_order_id', 'order_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
     payment_method = db.Column(db.String(100), nullable=False)
@@ -81,3 +133,186 @@ class Payment(db.Model):
     created_at = db.Column(db.DateTime, nullable=True)
 
 
+# Old finished/cancelled orders are moved here by archive.archive_orders so the live
+# tables only hold carts and recent orders. Same columns and ids as Order, OrderItem
+# and Payment; the archive is read-only.
+class ArchivedOrder(db.Model):
+    __tablename__ = "order_archive"
+    __table_args__ = (
+        db.Index('ix_order_archive_user_created_at', 'user_id', 'created_at', 'id'),
+        db.Index('ix_order_archive_status_created_at', 'status', 'created_at'),
+        db.Index('ix_order_archive_created_at', 'created_at', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    total_price = db.Column(db.Numeric(10, 2), nullable=True)
+    status = db.Column(db.String(255), nullable=True)
+    archived_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+    user = db.relationship("User")
+    order_items = db.relationship('ArchivedOrderItem', lazy=True)
+    payment = db.relationship('ArchivedPayment', uselist=False)
+
+    archived = True
+
+class ArchivedOrderItem(db.Model):
+    __tablename__ = "order_item_archive"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    quantity = db.Column(db.Integer, nullable=True)
+    price_at_time = db.Column(db.Numeric(10, 2), nullable=True)
+    sticker_id = db.Column(db.Integer, db.ForeignKey('sticker.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order_archive.id'), nullable=False, index=True)
+
+    sticker = db.relationship("Sticker")
+
+class ArchivedPayment(db.Model):
+    __tablename__ = "payment_archive"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order_archive.id'), nullable=False, index=True)
+    payment_method = db.Column(db.String(100), nullable=False)
+    full_name = db.Column(db.String(100), nullable=True)
+    email = db.Column(db.String(255), nullable=True)
+    date = db.Column(db.String(20), nullable=True)
+    time = db.Column(db.String(20), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+
+
+class CatalogVersion(db.Model):
+    # Single row (id=1), bumped by every write that changes what the shop shows
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    # When the version was last bumped; Last-Modified of the listing pages
+    changed_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+class IdempotencyKey(db.Model):
+    # One row per checkout form submission key, so a retried submit replays the outcome
+    __tablename__ = "idempotency_key"
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_key_user_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    key = db.Column(db.String(64), nullable=False)
+    order_id = db.Column(db.Integer, nullable=True)
+    response_url = db.Column(db.String(255), nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+class StockReservation(db.Model):
+    # A temporary hold on stock for an order that reached checkout.
+    # Available stock = on-hand stock (see inventory.py) - active (unexpired) holds.
+    __table_args__ = (
+        db.Index('ix_stock_reservation_sticker_expires', 'sticker_id', 'expires_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id', ondelete='CASCADE'), nullable=False, index=True)
+    sticker_id = db.Column(db.Integer, db.ForeignKey('sticker.id'), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+
+class StockShard(db.Model):
+    # Live stock of a sticker split over a few rows, so concurrent checkouts of the
+    # same sticker update different rows instead of queueing on one
+    sticker_id = db.Column(db.Integer, db.ForeignKey('sticker.id', ondelete='CASCADE'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    remaining = db.Column(db.Integer, nullable=False, default=0)
+
+class InventoryMovement(db.Model):
+    # Append-only stock ledger. Sticker.stock + uncompacted deltas == sum of the shards;
+    # the compaction job folds the deltas into Sticker.stock.
+    id = db.Column(db.Integer, primary_key=True)
+    sticker_id = db.Column(db.Integer, db.ForeignKey('sticker.id', ondelete='CASCADE'), nullable=False, index=True)
+    shard = db.Column(db.Integer, nullable=True)
+    delta = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)
+    order_id = db.Column(db.Integer, nullable=True)
+    compacted = db.Column(db.Boolean, nullable=False, default=False, index=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+class EmailOutbox(db.Model):
+    # Outgoing mail, written by send_email and delivered by the `flask send-emails` worker
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        db.Index('ix_email_outbox_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    subject = db.Column(db.String(255), nullable=False, default="")
+    sender = db.Column(db.String(255), nullable=True)
+    recipients = db.Column(db.JSON, nullable=False)
+    cc = db.Column(db.JSON, nullable=True)
+    bcc = db.Column(db.JSON, nullable=True)
+    reply_to = db.Column(db.String(255), nullable=True)
+    body = db.Column(db.Text, nullable=True)
+    html = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, sending, sent, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # For "sending" rows: when the worker's claim expires and another worker may retry
+    next_attempt_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+    sent_at = db.Column(db.DateTime(timezone=True), nullable=True)
+
+# Daily sales rollups, kept up to date by analytics.record_order_change and rebuilt
+# with `flask backfill-analytics`. The admin dashboard only reads these.
+
+class DailyOrderStats(db.Model):
+    # Orders and revenue per day and status
+    day = db.Column(db.Date, primary_key=True)
+    status = db.Column(db.String(255), primary_key=True)
+    orders = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal("0.00"))
+
+class DailyStickerSales(db.Model):
+    # Units and revenue per day and sticker, for orders that are not cancelled
+    day = db.Column(db.Date, primary_key=True)
+    sticker_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal("0.00"))
+
+class DailyCategorySales(db.Model):
+    day = db.Column(db.Date, primary_key=True)
+    category_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    units = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Numeric(12, 2), nullable=False, default=Decimal("0.00"))
+
+class ImageUpload(db.Model):
+    # An uploaded image spooled to local disk, waiting for `flask process-uploads` to
+    # push it to the storage backend and set image_url on its sticker
+    __table_args__ = (
+        db.Index('ix_image_upload_status_next_attempt', 'status', 'next_attempt_at'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    path = db.Column(db.String(500), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    sha256 = db.Column(db.String(64), nullable=True)
+    target = db.Column(db.String(20), nullable=False)  # sticker, custom_sticker
+    target_id = db.Column(db.Integer, nullable=False)
+    # Activate the sticker once its first image is stored
+    activate = db.Column(db.Boolean, nullable=False, default=False)
+    status = db.Column(db.String(20), nullable=False, default="pending")  # pending, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    next_attempt_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+class StoredImage(db.Model):
+    # Every image pushed to the storage backend, by content hash. An upload whose
+    # SHA-256 is already here reuses the stored URL instead of being uploaded again.
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), nullable=False, unique=True)
+    # 64-bit difference hash (hex), close values mean visually similar images
+    phash = db.Column(db.String(16), nullable=True, index=True)
+    image_url = db.Column(db.String(500), nullable=False)
+    image_variants = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+class BootstrapStep(db.Model):
+    # Which version of each `flask bootstrap` step has run against this database
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False)
+    applied_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
@@ -0,0 +1,148 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from flask import current_app, request
+from sqlalchemy import and_, or_
+from extensions import db
+
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 100
+
+
+class Page:
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def get_page_size():
+    default = current_app.config.get("PAGE_SIZE", DEFAULT_PAGE_SIZE)
+    per_page = request.args.get("per_page", default, type=int)
+    return max(1, min(per_page, MAX_PAGE_SIZE))
+
+
+def encode_cursor(values, direction):
+    values = [v.isoformat() if isinstance(v, datetime) else v for v in values]
+    raw = json.dumps({"v": values, "d": direction}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, columns=()):
+    # Returns (values, direction); a missing or broken cursor means "first page"
+    if not cursor:
+        return None, "next"
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        values, direction = data["v"], data["d"]
+        if direction not in ("next", "prev") or (columns and len(values) != len(columns)):
+            return None, "next"
+        for i, column in enumerate(columns):
+            if isinstance(column.type, db.DateTime) and values[i]:
+                values[i] = datetime.fromisoformat(values[i])
+        return values, direction
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        return None, "next"
+
+
+def _after(columns, values, descending):
+    # (a, b) > (x, y)  is  a > x OR (a = x AND b > y)
+    clauses = []
+    for i, column in enumerate(columns):
+        equal = [columns[j] == values[j] for j in range(i)]
+        compare = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal, compare))
+    return or_(*clauses)
+
+
+def paginate(query, columns, descending=False, cursor=None, per_page=None):
+    # Keyset pagination: the key columns must be non-null and end with a unique column (id)
+    return paginate_union([(query, columns)], descending, cursor, per_page)
+
+
+def paginate_union(sources, descending=False, cursor=None, per_page=None):
+    # Keyset pagination over several queries as if they were one, e.g. live and
+    # archived orders: [(query, columns), ...] with the same kind of key in each.
+    # Every query reads at most one page, the rows are merged by key.
+    if cursor is None:
+        cursor = request.args.get("cursor")
+    per_page = per_page or get_page_size()
+    values, direction = decode_cursor(cursor, sources[0][1])
+    names = [column.key for column in sources[0][1]]
+    backwards = direction == "prev"
+
+    def key(row):
+        return [getattr(row, name) for name in names]
+
+    # Walking backwards flips the sort order, the rows get reversed afterwards
+    reverse_order = descending != backwards
+    keyed = []
+    for query, columns in sources:
+        if values is not None:
+            query = query.filter(_after(columns, values, reverse_order))
+        query = query.order_by(*[c.desc() if reverse_order else c.asc() for c in columns])
+        keyed += [(key(row), row) for row in query.limit(per_page + 1)]
+
+    if len(sources) > 1:
+        keyed.sort(key=lambda pair: pair[0], reverse=reverse_order)
+    rows = [row for _, row in keyed]
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    has_next = has_more if not backwards else values is not None
+    has_prev = has_more if backwards else values is not None
+
+    return Page(
+        rows,
+        next_cursor=encode_cursor(key(rows[-1]), "next") if rows and has_next else None,
+        prev_cursor=encode_cursor(key(rows[0]), "prev") if rows and has_prev else None,
+    )
+
+
+def paginate_sequence(keys, cursor=None, per_page=None):
+    # Same cursors over an already ordered list of keys (e.g. ranked search hits)
+    if cursor is None:
+        cursor = request.args.get("cursor")
+    per_page = per_page or get_page_size()
+    values, direction = decode_cursor(cursor)
+
+    position = None
+    if values and values[0] in keys:
+        position = keys.index(values[0])
+
+    if position is None:
+        start = 0
+    elif direction == "next":
+        start = position + 1
+    else:
+        start = max(0, position - per_page)
+    end = min(start + per_page, position if direction == "prev" and position is not None else len(keys))
+    items = keys[start:end]
+
+    return Page(
+        items,
+        next_cursor=encode_cursor([items[-1]], "next") if items and end < len(keys) else None,
+        prev_cursor=encode_cursor([items[0]], "prev") if items and start > 0 else None,
+    )
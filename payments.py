@@ -2,10 +2,14 @@ from flask import Blueprint, abort, current_app, redirect, url_for, flash, sessi
 from flask_mail import Message
 import pytz
 from utils import login_required
-from models import Order, Payment, User
+from models import Order, Payment, User, IdempotencyKey, utcnow
 from datetime import datetime
+from sqlalchemy.exc import IntegrityError
+import uuid
 from extensions import db
 from email_utils import send_email
+from analytics import record_order_change
+from inventory import order_quantities, decrement_stock, reserve_stock
 
 
 # stripe.api_key = os.getenv("STRIPE_SECRET_KEY")
@@ -24,10 +28,23 @@ def checkout():
 
     user = User.query.get_or_404(user_id)
 
+    # Hold the cart's stock while the customer fills in the form
+    shortages = reserve_stock(order.id, order_quantities(order.id))
+    if shortages:
+        db.session.rollback()
+        for shortage in shortages:
+            flash(
+                f"Not enough stock for {shortage.name}. Available: {shortage.available}",
+                "error"
+            )
+        return redirect(url_for('shop.cart'))
+    db.session.commit()
+
     return render_template(
         "checkout.html",
         email=user.email,
-        order=order
+        order=order,
+        idempotency_key=uuid.uuid4().hex
     )
 
 
@@ -35,62 +52,120 @@ def checkout():
 @payments.route('/process_checkout', methods=['POST'])
 @login_required
 def process_checkout():
-    if request.method == 'POST':
-        full_name = request.form.get('full_name')
-        email = request.form.get('email')
-        date = request.form.get('date')
-        time = request.form.get('time')
-        payment_method = request.form.get('payment_method')
-        order_id = request.form.get('order_id')
-
-        if not order_id:
-            abort(400)
-        
-        order_id = int(order_id)
-        order = Order.query.get_or_404(order_id)
-
-        for item in order.order_items:
-            sticker = item.sticker
-            if sticker.stock < item.quantity:
+    order_id = request.form.get('order_id')
+    if not order_id:
+        abort(400)
+    order_id = int(order_id)
+    # Only the user's own orders, checked before a key is stored for them
+    Order.query.filter_by(id=order_id, user_id=session['user_id']).first_or_404()
+
+    # A resubmitted form (bad connection, double click) carries the same key: replay
+    # the stored outcome instead of charging and decrementing stock again
+    key = request.form.get('idempotency_key')
+    if key:
+        attempt, is_new = claim_idempotency_key(session['user_id'], key, order_id)
+        if not is_new:
+            if attempt.response_url:
+                return redirect(attempt.response_url)
+            flash("Your order is still being processed.", "info")
+            return redirect(url_for('payments.checkout_success', order_id=attempt.order_id))
+
+    try:
+        response_url = place_order(order_id)
+    except BaseException:
+        # No outcome to replay (e.g. a 404): drop the key so a retry runs again
+        if key:
+            db.session.rollback()
+            IdempotencyKey.query.filter_by(id=attempt.id).delete(synchronize_session=False)
+            db.session.commit()
+        raise
+
+    if key:
+        attempt.response_url = response_url
+        db.session.commit()
+    return redirect(response_url)
+
+
+def claim_idempotency_key(user_id, key, order_id):
+    # Returns (attempt, is_new). The unique (user_id, key) constraint decides the winner
+    # when two submits race.
+    attempt = IdempotencyKey(user_id=user_id, key=key[:64], order_id=order_id, created_at=utcnow())
+    db.session.add(attempt)
+    try:
+        db.session.commit()
+        return attempt, True
+    except IntegrityError:
+        db.session.rollback()
+        existing = IdempotencyKey.query.filter_by(user_id=user_id, key=key[:64]).first()
+        return existing, False
+
+
+def place_order(order_id):
+    # Runs the checkout transaction and returns the URL to send the user to
+    full_name = request.form.get('full_name')
+    email = request.form.get('email')
+    date = request.form.get('date')
+    time = request.form.get('time')
+    payment_method = request.form.get('payment_method')
+
+    order = Order.query.filter_by(id=order_id, user_id=session['user_id']).first_or_404()
+
+    if order.status != "cart":
+        flash("This order has already been placed.", "info")
+        return url_for('payments.checkout_success', order_id=order_id)
+
+    quantities = order_quantities(order_id)
+    if not quantities:
+        flash("Your cart is empty")
+        return url_for('shop.cart')
+
+    try:
+        # Reduce stock for all items at once; nothing is kept if any item is short
+        shortages = decrement_stock(quantities, order_id)
+        if shortages:
+            db.session.rollback()
+            for shortage in shortages:
                 flash(
-                    f"Not enough stock for {sticker.name}. Available: {sticker.stock}",
+                    f"Not enough stock for {shortage.name}. Available: {shortage.available}",
                     "error"
                 )
-                return redirect(url_for('shop.cart'))
-        try:
-            # Create Payment record
-            payment = Payment(
-                order_id=order_id,
-                payment_method=payment_method,
-                full_name=full_name,
-                email=email,
-                date=date,
-                time=time,
-                created_at=datetime.now(pytz.timezone('Europe/Amsterdam'))
-            )
-            db.session.add(payment)
+            return url_for('shop.cart')
+
+        # Create Payment record
+        payment = Payment(
+            order_id=order_id,
+            payment_method=payment_method,
+            full_name=full_name,
+            email=email,
+            date=date,
+            time=time,
+            created_at=datetime.now(pytz.timezone('Europe/Amsterdam'))
+        )
+        db.session.add(payment)
+
+        # Only a cart can become an order, so a concurrent submit of the same cart fails here
+        placed = Order.query.filter_by(id=order_id, status="cart").update(
+            {"status": "pending"}, synchronize_session=False
+        )
+        if not placed:
+            db.session.rollback()
+            flash("This order has already been placed.", "info")
+            return url_for('payments.checkout_success', order_id=order_id)
 
-            order.status = "pending"
+        record_order_change(order_id, "cart", "pending")
+        db.session.commit()
 
-            # Reduce stock
-            for item in order.order_items:
-                item.sticker.stock -= item.quantity
+        flash("Order placed successfully!", "success")
+        return url_for('payments.checkout_success', order_id=order_id)
 
-            db.session.commit()
-
-            flash("Order placed successfully!", "success")
-            return redirect(url_for('payments.checkout_success', order_id=order_id))
-        
-        except Exception as e:
-            db.session.rollback()
-            flash("Something went wrong during checkout.", "error")
-            return redirect(url_for('shop.cart'))
+    except Exception as e:
+        db.session.rollback()
+        flash("Something went wrong during checkout.", "error")
+        return url_for('shop.cart')
 
 @payments.route('/checkout-success/<int:order_id>')
+@login_required
 def checkout_success(order_id):
-    order = Order.query.get_or_404(order_id)
-    if not order:
-        flash("Order not found.")
-        return redirect(url_for('shop.index'))
+    order = Order.query.filter_by(id=order_id, user_id=session['user_id']).first_or_404()
 
     return render_template("checkout_success.html", order=order)
@@ -0,0 +1,95 @@
+import re
+from sqlalchemy import event, func, select
+from models import User, Order, Category, Sticker
+from extensions import db
+
+
+# Pages whose queries are checked, per kind of visitor. Best run against a database
+# filled with `flask generate-data`, plans on a near-empty database say little.
+# Only pages that read: /checkout is left out, it reserves stock.
+USER_ROUTES = [
+    "/", "/search?search=sticker", "/category/{category}", "/sticker/{sticker}",
+    "/cart", "/user_order_history", "/user_order_history?archived=1", "/my_requests",
+]
+ADMIN_ROUTES = [
+    "/admin_orders", "/admin_orders?status=pending", "/admin_orders?archived=1", "/index_admin", "/suggestions", "/analytics",
+]
+
+SQLITE_SCAN = re.compile(r"SCAN (\w+)\b(?! USING (?:COVERING )?INDEX)")
+
+
+def _capture(app, user, routes, params):
+    # [(route, statement, parameters)] for every SELECT the pages run
+    captured, current = [], [None]
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().upper().startswith("SELECT"):
+            captured.append((current[0], statement, parameters))
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session["username"] = user.username
+        session["user_id"] = user.id
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        for route in routes:
+            current[0] = route.format(**params)
+            client.get(current[0])
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    return captured
+
+
+def _scanned_tables(conn, statement, parameters):
+    # Tables the plan reads front to back
+    if conn.dialect.name == "postgresql":
+        plan = conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+        nodes = [plan[0]["Plan"]]
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.get("Plans", []))
+            if node["Node Type"] == "Seq Scan":
+                yield node["Relation Name"]
+    else:
+        for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters):
+            match = SQLITE_SCAN.match(row[-1])
+            if match:
+                # SQLite reports the alias; joinedload aliases are "<table>_<n>"
+                yield re.sub(r"_\d+$", "", match.group(1)) if match.group(1) not in db.metadata.tables else match.group(1)
+
+
+def check_query_plans(app, max_rows=1000):
+    # Runs EXPLAIN on the queries behind the main pages and returns
+    # [(route, table, rows, statement)] for sequential scans of tables with more
+    # than max_rows rows. The busiest user and the first admin are used.
+    user = db.session.query(User).join(Order, Order.user_id == User.id).group_by(User.id).order_by(
+        func.count(Order.id).desc()
+    ).first() or User.query.first()
+    admin = User.query.filter_by(is_admin=True).first()
+    params = {
+        "category": db.session.query(Category.name).order_by(Category.id).limit(1).scalar(),
+        "sticker": db.session.query(Sticker.id).filter(Sticker.is_active == True).order_by(Sticker.id).limit(1).scalar(),
+    }
+    db.session.commit()
+
+    captured = []
+    if user is not None:
+        captured += _capture(app, user, USER_ROUTES, params)
+    if admin is not None:
+        captured += _capture(app, admin, ADMIN_ROUTES, params)
+
+    problems, seen, counts = [], set(), {}
+    with db.engine.connect() as conn:
+        for route, statement, parameters in captured:
+            if statement in seen:
+                continue
+            seen.add(statement)
+            for table in _scanned_tables(conn, statement, parameters):
+                if table not in db.metadata.tables:
+                    continue
+                if table not in counts:
+                    counts[table] = conn.execute(select(func.count()).select_from(db.metadata.tables[table])).scalar()
+                if counts[table] > max_rows:
+                    problems.append((route, table, counts[table], statement))
+    return problems, len(seen)
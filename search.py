@@ -0,0 +1,193 @@
+import re
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError
+from models import Sticker
+from extensions import db
+
+
+# Maximum number of ranked hits a single search returns
+SEARCH_RESULT_LIMIT = 500
+
+# Postgres: one row per sticker with a weighted tsvector (name > category > description)
+# plus the plain text for pg_trgm typo matching. Both have a GIN index.
+PG_SCHEMA = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    CREATE TABLE IF NOT EXISTS sticker_search (
+        sticker_id INTEGER PRIMARY KEY REFERENCES sticker(id) ON DELETE CASCADE,
+        body TEXT NOT NULL,
+        document TSVECTOR NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_sticker_search_document ON sticker_search USING GIN (document)",
+    "CREATE INDEX IF NOT EXISTS ix_sticker_search_body_trgm ON sticker_search USING GIN (body gin_trgm_ops)",
+]
+
+PG_UPSERT = """
+    INSERT INTO sticker_search (sticker_id, body, document)
+    VALUES (
+        :id,
+        :body,
+        setweight(to_tsvector('simple', :name), 'A')
+        || setweight(to_tsvector('simple', :category), 'B')
+        || setweight(to_tsvector('simple', :description), 'C')
+    )
+    ON CONFLICT (sticker_id) DO UPDATE SET body = EXCLUDED.body, document = EXCLUDED.document
+"""
+
+PG_SEARCH = """
+    SELECT s.sticker_id
+    FROM sticker_search s
+    JOIN sticker st ON st.id = s.sticker_id
+    WHERE st.is_active = true
+      AND (s.document @@ to_tsquery('simple', :tsquery) OR :query <% s.body)
+    ORDER BY ts_rank(s.document, to_tsquery('simple', :tsquery)) + word_similarity(:query, s.body) DESC,
+             s.sticker_id
+    LIMIT :limit
+"""
+
+# SQLite (local development): an FTS5 table whose rowid is the sticker id
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS sticker_search
+    USING fts5(name, category, description, tokenize = 'unicode61 remove_diacritics 2')
+    """,
+]
+
+SQLITE_SEARCH = """
+    SELECT sticker_search.rowid
+    FROM sticker_search
+    JOIN sticker ON sticker.id = sticker_search.rowid
+    WHERE sticker_search MATCH :match AND sticker.is_active = 1
+    ORDER BY bm25(sticker_search, 10.0, 5.0, 1.0), sticker_search.rowid
+    LIMIT :limit
+"""
+
+# "postgresql", "sqlite", or None for the ilike fallback. Set by ensure_search_index()
+# (flask bootstrap / reindex-search); web workers detect it on first use.
+_UNKNOWN = object()
+_backend = _UNKNOWN
+
+
+def search_backend():
+    global _backend
+    if _backend is _UNKNOWN:
+        dialect = _dialect()
+        has_index = dialect in ("postgresql", "sqlite") and inspect(db.engine).has_table("sticker_search")
+        _backend = dialect if has_index else None
+    return _backend
+
+
+def _dialect():
+    return db.engine.dialect.name
+
+
+def _tokens(query):
+    return re.findall(r"\w+", (query or "").lower())
+
+
+def ensure_search_index():
+    global _backend
+
+    dialect = _dialect()
+    if dialect == "postgresql":
+        statements = PG_SCHEMA
+    elif dialect == "sqlite":
+        statements = SQLITE_SCHEMA
+    else:
+        _backend = None
+        return
+
+    try:
+        for statement in statements:
+            db.session.execute(text(statement))
+        db.session.commit()
+    except OperationalError as e:
+        # e.g. SQLite built without FTS5, or no permission to create pg_trgm
+        db.session.rollback()
+        print("Search index unavailable, falling back to ilike:", e)
+        _backend = None
+        return
+
+    _backend = dialect
+
+    indexed = db.session.execute(text("SELECT count(*) FROM sticker_search")).scalar()
+    if not indexed:
+        rebuild_search_index()
+
+
+def rebuild_search_index():
+    if search_backend() is None:
+        return
+
+    db.session.execute(text("DELETE FROM sticker_search"))
+    for sticker in Sticker.query.all():
+        index_sticker(sticker, commit=False)
+    db.session.commit()
+
+
+def index_sticker(sticker, commit=True):
+    backend = search_backend()
+    if backend is None:
+        return
+
+    params = {
+        "id": sticker.id,
+        "name": sticker.name or "",
+        "category": sticker.category.name if sticker.category else "",
+        "description": sticker.description or "",
+    }
+
+    if backend == "postgresql":
+        params["body"] = " ".join([params["name"], params["category"], params["description"]])
+        db.session.execute(text(PG_UPSERT), params)
+    else:
+        db.session.execute(text("DELETE FROM sticker_search WHERE rowid = :id"), {"id": sticker.id})
+        db.session.execute(
+            text("INSERT INTO sticker_search (rowid, name, category, description) "
+                 "VALUES (:id, :name, :category, :description)"),
+            params
+        )
+
+    if commit:
+        db.session.commit()
+
+
+def search_sticker_ids(query, limit=SEARCH_RESULT_LIMIT):
+    tokens = _tokens(query)
+    if not tokens:
+        return []
+
+    backend = search_backend()
+    if backend == "postgresql":
+        rows = db.session.execute(text(PG_SEARCH), {
+            "tsquery": " & ".join(f"{token}:*" for token in tokens),
+            "query": " ".join(tokens),
+            "limit": limit,
+        })
+    elif backend == "sqlite":
+        rows = db.session.execute(text(SQLITE_SEARCH), {
+            "match": " ".join(f'"{token}"*' for token in tokens),
+            "limit": limit,
+        })
+    else:
+        pattern = f"%{query}%"
+        rows = db.session.query(Sticker.id).filter(
+            Sticker.is_active == True,
+            Sticker.name.ilike(pattern) | Sticker.description.ilike(pattern)
+        ).order_by(Sticker.id).limit(limit)
+
+    return [row[0] for row in rows]
+
+
+def load_stickers(ids):
+    if not ids:
+        return []
+
+    # Keep the ranking order from the index
+    stickers = {s.id: s for s in Sticker.query.filter(Sticker.id.in_(ids)).all()}
+    return [stickers[i] for i in ids if i in stickers]
+
+
+def search_stickers(query, limit=SEARCH_RESULT_LIMIT):
+    return load_stickers(search_sticker_ids(query, limit))
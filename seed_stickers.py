@@ -1,5 +1,6 @@
 from decimal import Decimal
-from models import Category, Sticker
+from models import Sticker
+from fixtures import load_stickers
 from extensions import db
 
 STICKERS_DATA = [
@@ -146,28 +147,6 @@ def clear_stickers():
     db.session.commit()
 
 def generate_stickers():
-    for data in STICKERS_DATA:
-        category = Category.query.filter_by(name=data["category_name"]).first()
-        if not category:
-            print(f"Category '{data['category_name']}' not found, skipping.")
-            continue
-
-        existing = Sticker.query.filter_by(name=data["name"]).first()
-        if existing:
-            print(f"Sticker '{data['name']}' already exists, skipping.")
-            continue
-
-        sticker = Sticker(
-            name=data["name"],
-            price=data["price"],
-            category_id=category.id,
-            description=data["description"],
-            image_url=data["image_url"],
-            stock=data["stock"],
-            is_active=True
-        )
-
-        db.session.add(sticker)
-
-    db.session.commit()
-    print("Stickers generated successfully")
\ No newline at end of file
+    # Adds the seed stickers that don't exist yet (see fixtures.load_stickers)
+    added = load_stickers(STICKERS_DATA)
+    print(f"Stickers generated successfully ({added} added)")
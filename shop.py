@@ -1,15 +1,20 @@
 import pytz
-import cloudinary
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, jsonify
+from flask import Blueprint, abort, render_template, request, redirect, url_for, flash, session, jsonify
 import pytz
-from models import Sticker, Order, OrderItem, Category, CustomSticker
+from models import Sticker, Order, OrderItem, Category, CustomSticker, ArchivedOrder
 from utils import login_required
+from search import search_sticker_ids, load_stickers
+from pagination import paginate, paginate_sequence, paginate_union
+from catalog_cache import get_catalog, bump_catalog_version
+from http_cache import cached_page
+from database import replica_reads
+from inventory import available_stock_expr
+from uploads import enqueue_upload
+from cart import add_item_to_cart, apply_cart_operations, apply_guest_cart_operations, guest_cart_items
 from werkzeug.utils import secure_filename
 from extensions import db
-from datetime import datetime, timezone
-from decimal import Decimal
+from datetime import datetime
 import os
-import cloudinary.uploader
 
 
 
@@ -17,45 +22,31 @@ shop = Blueprint('shop', __name__, static_folder="static", template_folder="temp
 
 
 @shop.route('/add_to_cart', methods=['POST'])
-@login_required
 def add_to_cart():
-    sticker_id = request.form.get('sticker_id')
-    user_id = session['user_id']
+    sticker_id = request.form.get('sticker_id', type=int)
+    user_id = session.get('user_id')
 
-    sticker = Sticker.query.get(sticker_id)
+    # 1. Look up the price, from the catalog snapshot when the sticker is active
+    sticker = None
+    if sticker_id:
+        sticker = get_catalog().get(sticker_id) or db.session.get(Sticker, sticker_id)
     if not sticker:
         flash("Sticker not found.", "error")
         return redirect(request.referrer or url_for('shop.index'))
 
-    # 1. Get or Create the Order (Cart)
-    order = Order.query.filter_by(user_id=user_id, status="cart").first()
-    if not order:
-        order = Order(user_id=user_id, created_at=datetime.now(timezone.utc), status="cart", total_price=0)
-        db.session.add(order)
-        db.session.flush() # Flush ensures we get an ID for the order immediately
-
-    # 2. Add Item or Increase Quantity
-    item = OrderItem.query.filter_by(order_id=order.id, sticker_id=sticker.id).first()
-    if item:
-        item.quantity += 1
+    # 2. Upsert cart + line item and get the new badge count in the same transaction.
+    #    Guests get a cookie cart instead, which is merged on login.
+    if user_id:
+        total_quantity = add_item_to_cart(user_id, sticker.id, sticker.price)
+        db.session.commit()
     else:
-        item = OrderItem(
-            quantity=1,
-            price_at_time=Decimal(str(sticker.price)),
-            sticker_id=sticker.id,
-            order_id=order.id
-        )
-        db.session.add(item)
+        try:
+            total_quantity = apply_guest_cart_operations([{'op': 'add', 'sticker_id': sticker.id}])['total_quantity']
+        except ValueError as e:
+            flash(str(e), "error")
+            return redirect(request.referrer or url_for('shop.index'))
 
-    # 3. Update Total Price and Save
-    order.total_price += Decimal(str(sticker.price))
-    db.session.commit()
-
-    # 4. Calculate Total Quantity from Database (The Fix)
-    # We loop through the items in the order we just updated to get the real count
-    total_quantity = sum(item.quantity for item in order.order_items)
-
-    # 5. Return JSON for the JavaScript Notification
+    # 3. Return JSON for the JavaScript Notification
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return jsonify({
             'success': True,
@@ -63,7 +54,7 @@ def add_to_cart():
             'total_quantity': total_quantity
         })
 
-    # 6. Fallback for non-JS browsers
+    # 4. Fallback for non-JS browsers
     return redirect(request.referrer or url_for('shop.index'))
 
 
@@ -73,16 +64,52 @@ def add_to_cart():
 
 
 @shop.route('/cart')
-@login_required
 def cart():
+    if 'user_id' not in session:
+        items = guest_cart_items()
+        total = sum(item.price_at_time * item.quantity for item in items)
+        return render_template('cart.html', items=items, total=total)
+
     order = Order.query.filter_by(user_id=session['user_id'], status="cart").first()
     if not order or not order.order_items:
         return render_template('cart.html', items=[], total=0)
     return render_template('cart.html', items=order.order_items, total=order.total_price)
 
+# Upper bound on operations per batch request
+MAX_BATCH_OPERATIONS = 100
+
+@shop.route('/cart/batch', methods=['POST'])
+def cart_batch():
+    # Applies several cart edits (add / set / remove) in one transaction.
+    # static/script.js debounces the +/- buttons into a single call to this.
+    data = request.get_json(silent=True) or {}
+    operations = data.get('operations')
+
+    if not isinstance(operations, list) or len(operations) > MAX_BATCH_OPERATIONS:
+        return jsonify({'success': False, 'error': 'Invalid operations'}), 400
+
+    try:
+        if 'user_id' in session:
+            state = apply_cart_operations(session['user_id'], operations)
+        else:
+            state = apply_guest_cart_operations(operations)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 400
+
+    db.session.commit()
+    return jsonify({'success': True, **state})
+
 @shop.route('/remove_from_cart/<int:item_id>')
-@login_required
 def remove_from_cart(item_id):
+    if 'user_id' not in session:
+        # Guest cart lines are identified by sticker id
+        try:
+            apply_guest_cart_operations([{'op': 'remove', 'item_id': item_id}])
+        except ValueError:
+            pass
+        return redirect(request.referrer or url_for('shop.cart'))
+
     item = OrderItem.query.get_or_404(item_id)
     order = item.order
     order.total_price -= item.price_at_time * item.quantity
@@ -131,14 +158,27 @@ def update_quantity(item_id):
 
 
 @shop.route('/')
+@replica_reads
 def index():
-    query = request.form.get('search', '')
-    if query:
-        results = Sticker.query.filter(Sticker.is_active == True, Sticker.name.ilike(f'%{query}%')).all()
-    else:
-        results = Sticker.query.filter_by(is_active=True).all()
+    query = request.args.get('search', '')
+    catalog = get_catalog()
+
+    def render():
+        if query:
+            page = search_page(query)
+        else:
+            page = paginate_sequence(catalog.sticker_ids)
+            page.items = catalog.load(page.items)
+        return render_template('index.html', stickers=page, page=page, query=query)
 
-    return render_template('index.html', stickers=results, query=query)
+    return cached_page(["index", catalog.version], render, catalog.last_modified)
+
+
+def search_page(query):
+    # Ranked ids are cheap; only the stickers on the current page get loaded
+    page = paginate_sequence(search_sticker_ids(query))
+    page.items = load_stickers(page.items)
+    return page
 
 
 UPLOAD_FOLDER = "static/images/stickers"   # folder for stickers
@@ -150,42 +190,61 @@ def allowed_file(filename):
 
 
 @shop.route('/search', methods=["GET", "POST"])
+@replica_reads
 def search():
     if request.method == "POST":
         query = request.form.get('search', '')
     else:
-        query = ''
+        query = request.args.get('search', '')
+
+    def render():
+        if query.strip():
+            page = search_page(query)
+        else:
+            page = paginate(Sticker.query.filter_by(is_active=True), [Sticker.id])
+        return render_template("search_results.html", search_results=page, page=page, query=query)
 
-    search_results = Sticker.query.filter(
-        Sticker.is_active == True,
-        Sticker.name.ilike(f"%{query}%")
-        ).all()
-    return render_template("search_results.html", search_results=search_results, query=query)
+    catalog = get_catalog()
+    return cached_page(["search", catalog.version], render, catalog.last_modified)
 
 @shop.route('/category/<category_name>', methods=["GET", "POST"])
+@replica_reads
 def category(category_name):
-    category = Category.query.filter_by(name=category_name).first_or_404()
-
-    active_stickers = Sticker.query.filter_by(
-        category_id=category.id,
-        is_active=True
-    ).all()
+    catalog = get_catalog()
+    category = catalog.categories.get(category_name)
+    if not category:
+        abort(404)
+
+    def render():
+        page = paginate_sequence(catalog.ids_by_category[category.name])
+        page.items = catalog.load(page.items)
+        return render_template(
+            "category.html",
+            category=category.name,
+            category_results=page,
+            page=page
+        )
 
-    return render_template(
-        "category.html",
-        category=category.name,
-        category_results=active_stickers
-    )
+    return cached_page(["category", catalog.version], render, catalog.last_modified)
 
 @shop.route("/user_order_history")
 @login_required
+@replica_reads
 def user_order_history():
     user_id = session["user_id"]
-    orders = Order.query.filter(
-        Order.user_id == user_id,
-        Order.status != "cart"
-    ).order_by(Order.created_at.desc()).all()
-    return render_template("user_order_history.html", orders=orders)
+    sources = [(
+        Order.query.filter(Order.user_id == user_id, Order.status != "cart"),
+        [Order.created_at, Order.id]
+    )]
+    # Older completed orders are archived, they are only read when asked for
+    archived = bool(request.args.get("archived"))
+    if archived:
+        sources.append((
+            ArchivedOrder.query.filter(ArchivedOrder.user_id == user_id),
+            [ArchivedOrder.created_at, ArchivedOrder.id]
+        ))
+    page = paginate_union(sources, descending=True)
+    return render_template("user_order_history.html", orders=page, page=page, archived=archived)
 
 
 @shop.route('/add_custom_to_cart', methods=['POST'])
@@ -207,6 +266,14 @@ def add_custom_to_cart():
         flash("This custom sticker is not approved yet.", "error")
         return redirect(url_for('shop.index'))
 
+    # The image is stored by the upload worker, a shop sticker needs it
+    if not custom.sticker_id and not custom.image_url:
+        if custom.image_status == "pending":
+            flash("Your sticker image is still being processed, try again in a moment.", "warning")
+        else:
+            flash("This custom sticker has no image, please upload it again.", "error")
+        return redirect(request.referrer or url_for('shop.my_requests'))
+
     if not custom.sticker_id:
         sticker = Sticker(
             name=custom.name,
@@ -226,29 +293,7 @@ def add_custom_to_cart():
     else:
         sticker = Sticker.query.get(custom.sticker_id)
 
-    order = Order.query.filter_by(user_id=user_id, status="cart").first()
-    if not order:
-        order = Order(user_id=user_id, status="cart", total_price=Decimal("0.00"))
-        db.session.add(order)
-        db.session.flush()
-
-    item = OrderItem.query.filter_by(
-        order_id=order.id,
-        sticker_id=sticker.id
-    ).first()
-
-    if item:
-        item.quantity += 1
-    else:
-        item = OrderItem(
-            quantity=1,
-            price_at_time=Decimal(str(sticker.price)),
-            sticker_id=sticker.id,
-            order_id=order.id
-        )
-        db.session.add(item)
-
-    order.total_price += Decimal(str(sticker.price))
+    add_item_to_cart(user_id, sticker.id, sticker.price)
     db.session.commit()
 
     flash("Custom sticker added to cart!", "success")
@@ -295,9 +340,26 @@ def add_sticker_user():
     return render_template("add_sticker_user.html")
 
 @shop.route("/sticker/<int:sticker_id>")
+@replica_reads
 def sticker_desc(sticker_id):
-    sticker = Sticker.query.get_or_404(sticker_id)
-    return render_template("sticker_desc.html", sticker=sticker)
+    # Stock changes with every checkout and reservation, so the available stock (and
+    # updated_at) is read fresh in one indexed query
+    row = db.session.query(available_stock_expr().label('stock'), Sticker.updated_at).filter(
+        Sticker.id == sticker_id
+    ).first()
+    if row is None:
+        abort(404)
+
+    def render():
+        # Inactive/custom stickers are not in the snapshot, those still come from the DB
+        sticker = get_catalog().get(sticker_id)
+        if sticker:
+            sticker = sticker._replace(stock=row.stock)
+        else:
+            sticker = Sticker.query.get_or_404(sticker_id)
+        return render_template("sticker_desc.html", sticker=sticker)
+
+    return cached_page(["sticker", sticker_id, row.updated_at, row.stock], render, row.updated_at)
 
 @shop.route("/my_requests")
 @login_required
@@ -310,6 +372,7 @@ def my_requests():
 def delete_sticker(sticker_id):
     sticker = Sticker.query.get_or_404(sticker_id)
     sticker.is_active = False
+    bump_catalog_version()
     db.session.commit()
     return redirect(url_for('admin.index_admin'))
 
@@ -333,19 +396,19 @@ def request_sticker():
             return redirect(url_for('shop.add_sticker_user'))
         
         if file and allowed_file(file.filename):
-            upload_result = cloudinary.uploader.upload(file)
-            image_url = upload_result['secure_url']
-
             new_request = CustomSticker(
                 user_id=session['user_id'],
                 name=name,
-                image_url=image_url,
                 description=description,
                 approval_status="pending",
                 request_approval=request_approval,
                 created_at=datetime.now(pytz.timezone('Europe/Amsterdam'))
             )
             db.session.add(new_request)
+            db.session.flush()
+
+            # The image is stored by the upload worker, not in this request
+            enqueue_upload(file, new_request)
             db.session.commit()
 
             flash("Your sticker has beeen submitted for approval!", "success")
@@ -0,0 +1,72 @@
+// Cart edits are queued here and sent to /cart/batch as one request once the
+// user stops clicking for a moment, instead of one request per click.
+const CartBatch = (function () {
+    const DELAY = 400;
+
+    let adds = [];
+    let edits = new Map();   // item id -> latest set/remove operation for it
+    let timer = null;
+    const listeners = [];
+
+    function schedule() {
+        clearTimeout(timer);
+        timer = setTimeout(flush, DELAY);
+    }
+
+    function takeOperations() {
+        const operations = adds.concat(Array.from(edits.values()));
+        adds = [];
+        edits = new Map();
+        return operations;
+    }
+
+    function add(stickerId, quantity = 1) {
+        adds.push({ op: 'add', sticker_id: Number(stickerId), quantity: quantity });
+        schedule();
+    }
+
+    function set(itemId, quantity) {
+        edits.set(itemId, { op: 'set', item_id: Number(itemId), quantity: quantity });
+        schedule();
+    }
+
+    function remove(itemId) {
+        edits.set(itemId, { op: 'remove', item_id: Number(itemId) });
+        schedule();
+    }
+
+    function onUpdate(callback) {
+        listeners.push(callback);
+    }
+
+    function flush() {
+        clearTimeout(timer);
+        const operations = takeOperations();
+        if (operations.length === 0) return Promise.resolve(null);
+
+        return fetch('/cart/batch', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+                'X-Requested-With': 'XMLHttpRequest'
+            },
+            body: JSON.stringify({ operations: operations })
+        })
+        .then(response => response.json())
+        .then(data => {
+            listeners.forEach(callback => callback(data));
+            return data;
+        })
+        .catch(error => console.error('Error:', error));
+    }
+
+    // Don't lose queued edits when the user navigates away (e.g. to checkout)
+    window.addEventListener('pagehide', function () {
+        const operations = takeOperations();
+        if (operations.length === 0) return;
+        const body = new Blob([JSON.stringify({ operations: operations })], { type: 'application/json' });
+        navigator.sendBeacon('/cart/batch', body);
+    });
+
+    return { add: add, set: set, remove: remove, flush: flush, onUpdate: onUpdate };
+})();
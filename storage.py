@@ -0,0 +1,49 @@
+import os
+import shutil
+import uuid
+import cloudinary.uploader
+from utils import UPLOAD_FOLDER
+
+
+# Where sticker images end up. "cloudinary" in production; "local" writes them to
+# static/images/stickers (the templates already serve bare file names from there),
+# which is handy for development and tests.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary")
+
+
+class CloudinaryStorage:
+    def save(self, fileobj, filename):
+        # Returns the https URL of the uploaded image
+        return cloudinary.uploader.upload(fileobj)["secure_url"]
+
+
+class LocalStorage:
+    def __init__(self, root=UPLOAD_FOLDER):
+        self.root = root
+
+    def save(self, fileobj, filename):
+        # Returns the stored file name, relative to static/images/stickers
+        ext = os.path.splitext(filename)[1].lower()
+        name = f"{uuid.uuid4().hex}{ext}"
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, name), "wb") as out:
+            shutil.copyfileobj(fileobj, out)
+        return name
+
+
+BACKENDS = {"cloudinary": CloudinaryStorage, "local": LocalStorage}
+
+_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        _storage = BACKENDS[STORAGE_BACKEND]()
+    return _storage
+
+
+def set_storage(storage):
+    # Swap the backend, e.g. LocalStorage(tmpdir) in tests
+    global _storage
+    _storage = storage
@@ -0,0 +1,39 @@
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # A fresh app on its own SQLite file, with the schema and default categories
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'test.db'}")
+    monkeypatch.setenv("FLASK_SECRET_KEY", "test")
+    from app import create_app
+    from bootstrap import _create_schema
+    from catalog_cache import invalidate_catalog
+    from utils import create_default_categories
+    from extensions import db
+
+    app = create_app()
+    app.config["TESTING"] = True
+    with app.app_context():
+        _create_schema()
+        create_default_categories()
+        invalidate_catalog()
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+    invalidate_catalog()
+
+
+@pytest.fixture
+def login(app):
+    # login(client, user): puts the user in the client's session like auth.login does
+    def login(client, user):
+        with client.session_transaction() as session:
+            session["username"] = user.username
+            session["user_id"] = user.id
+        return client
+    return login
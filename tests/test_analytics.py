@@ -0,0 +1,86 @@
+from datetime import datetime
+from decimal import Decimal
+import pytest
+from models import (
+    Category, DailyCategorySales, DailyOrderStats, DailyStickerSales, Order, OrderItem, Sticker, User
+)
+from analytics import backfill_analytics, record_order_change
+from extensions import db
+
+DAY = datetime(2026, 3, 14, 15, 9)
+
+
+@pytest.fixture
+def placed_order(app):
+    # A pending order from DAY: 3 x 2.00 + 1 x 0.50, placed the way checkout does it
+    user = User(username="analyst", email="analyst@example.test", password="x")
+    category = Category.query.first()
+    stickers = [
+        Sticker(name=name, price=price, category_id=category.id, image_url="a.webp")
+        for name, price in (("Rollup A", 2.00), ("Rollup B", 0.50))
+    ]
+    db.session.add_all([user] + stickers)
+    db.session.flush()
+    order = Order(user_id=user.id, created_at=DAY, status="cart", total_price=Decimal("6.50"))
+    db.session.add(order)
+    db.session.flush()
+    db.session.add_all([
+        OrderItem(order_id=order.id, sticker_id=stickers[0].id, quantity=3, price_at_time=Decimal("2.00")),
+        OrderItem(order_id=order.id, sticker_id=stickers[1].id, quantity=1, price_at_time=Decimal("0.50")),
+    ])
+    record_order_change(order.id, "cart", "pending")
+    order.status = "pending"
+    db.session.commit()
+    return order
+
+
+@pytest.fixture
+def admin_client(app, login):
+    admin = User(username="boss", email="boss@example.test", password="x", is_admin=True)
+    db.session.add(admin)
+    db.session.commit()
+    return login(app.test_client(), admin)
+
+
+def rollups():
+    # Every non-empty rollup row; the live updates leave zeroed rows behind, backfill doesn't
+    return (
+        {(r.day, r.status): (r.orders, r.revenue) for r in DailyOrderStats.query if r.orders},
+        {(r.day, r.sticker_id): (r.units, r.revenue) for r in DailyStickerSales.query if r.units},
+        {(r.day, r.category_id): (r.units, r.revenue) for r in DailyCategorySales.query if r.units},
+    )
+
+
+def test_placing_an_order_counts_it(placed_order):
+    orders, stickers, categories = rollups()
+    day = DAY.date()
+
+    assert orders == {(day, "pending"): (1, Decimal("6.50"))}
+    assert sorted(stickers.values()) == [(1, Decimal("0.50")), (3, Decimal("6.00"))]
+    assert categories == {(day, Category.query.first().id): (4, Decimal("6.50"))}
+
+
+def test_status_changes_move_the_counts(placed_order, admin_client):
+    day = DAY.date()
+
+    admin_client.post(f"/order/{placed_order.id}/status/finished")
+    orders, stickers, _ = rollups()
+    assert orders == {(day, "finished"): (1, Decimal("6.50"))}
+    assert sum(units for units, _ in stickers.values()) == 4
+
+    # Cancelling takes the units and revenue back out, the order still shows per status
+    admin_client.post(f"/order/{placed_order.id}/status/cancelled")
+    orders, stickers, categories = rollups()
+    assert orders == {(day, "cancelled"): (1, Decimal("6.50"))}
+    assert stickers == categories == {}
+
+
+@pytest.mark.parametrize("statuses", [["finished"], ["confirmed", "cancelled"], ["cancelled", "pending"]])
+def test_live_rollups_match_a_backfill(placed_order, admin_client, statuses):
+    for status in statuses:
+        admin_client.post(f"/order/{placed_order.id}/status/{status}")
+    live = rollups()
+
+    backfill_analytics()
+
+    assert rollups() == live
@@ -0,0 +1,87 @@
+import html
+import re
+from datetime import timedelta
+from decimal import Decimal
+import pytest
+from models import (
+    ArchivedOrder, ArchivedOrderItem, ArchivedPayment, Category, Order, OrderItem, Payment, Sticker, User, utcnow
+)
+from archive import archive_orders
+from extensions import db
+
+# (age in days, status) of the customer's orders, oldest first
+HISTORY = [
+    (400, "finished"), (300, "cancelled"), (250, "finished"), (200, "pending"),
+    (190, "finished"), (20, "finished"), (10, "confirmed"), (1, "pending"),
+]
+
+
+@pytest.fixture
+def customer(app):
+    # A customer with HISTORY, each order with one line and a payment. Returns
+    # (user, order ids newest first).
+    user = User(username="regular", email="regular@example.test", password="x")
+    sticker = Sticker(name="Archived", price=1.0, category_id=Category.query.first().id, image_url="a.webp")
+    db.session.add_all([user, sticker])
+    db.session.flush()
+
+    now = utcnow().replace(tzinfo=None)
+    ids = []
+    for days, status in HISTORY:
+        order = Order(user_id=user.id, created_at=now - timedelta(days=days), status=status, total_price=Decimal("2.00"))
+        db.session.add(order)
+        db.session.flush()
+        db.session.add(OrderItem(order_id=order.id, sticker_id=sticker.id, quantity=2, price_at_time=Decimal("1.00")))
+        db.session.add(Payment(order_id=order.id, payment_method="cash", created_at=order.created_at))
+        ids.append(order.id)
+    db.session.commit()
+    return user, ids[::-1]
+
+
+def test_moves_old_completed_orders_with_their_lines(customer):
+    user, ids = customer
+    old_completed = {ids[-1], ids[-2], ids[-3], ids[-5]}
+
+    assert archive_orders(days=180, batch_size=3) == 4
+
+    assert {o.id for o in ArchivedOrder.query} == old_completed
+    assert {i.order_id for i in ArchivedOrderItem.query} == old_completed
+    assert {p.order_id for p in ArchivedPayment.query} == old_completed
+    # The old pending order isn't done yet, so it stays live
+    assert {o.id for o in Order.query} == set(ids) - old_completed
+    assert {i.order_id for i in OrderItem.query} == {p.order_id for p in Payment.query} == set(ids) - old_completed
+    assert archive_orders(days=180) == 0
+
+
+def order_history(client, url):
+    # (order ids shown, previous page url, next page url)
+    page = client.get(url).get_data(as_text=True)
+    prev_link = re.search(r'href="([^"#]+)">\s*<i class="bi bi-chevron-left">', page)
+    next_link = re.search(r'href="([^"#]+)">\s*Next', page)
+    return (
+        [int(order_id) for order_id in re.findall(r"Order #(\d+)", page)],
+        html.unescape(prev_link.group(1)) if prev_link else None,
+        html.unescape(next_link.group(1)) if next_link else None,
+    )
+
+
+def test_history_pages_through_live_and_archived_orders(app, login, customer):
+    user, ids = customer
+    archive_orders(days=180)
+    client = login(app.test_client(), user)
+
+    # Live orders only by default
+    assert order_history(client, "/user_order_history?per_page=20")[0] == [ids[0], ids[1], ids[2], ids[4]]
+
+    pages, url = [], "/user_order_history?archived=1&per_page=3"
+    while url:
+        shown, _, url = order_history(client, url)
+        pages.append(shown)
+    assert pages == [ids[0:3], ids[3:6], ids[6:]]
+
+    back, url = [], order_history(client, "/user_order_history?archived=1&per_page=3")[2]
+    url = order_history(client, url)[2]
+    while url:
+        shown, url, _ = order_history(client, url)
+        back.append(shown)
+    assert back == [ids[6:], ids[3:6], ids[0:3]]
@@ -0,0 +1,66 @@
+from decimal import Decimal
+import pytest
+from sqlalchemy.exc import IntegrityError
+from models import Category, Order, OrderItem, Sticker, User, utcnow
+from cart import add_item_to_cart, get_or_create_cart_id
+from extensions import db
+
+
+@pytest.fixture
+def shopper(app):
+    user = User(username="shopper", email="shopper@example.test")
+    user.set_password("password")
+    category_id = Category.query.first().id
+    stickers = [
+        Sticker(name=f"Cart {n}", price=price, category_id=category_id, image_url="cart.webp", stock=10)
+        for n, price in enumerate((0.49, 1.99))
+    ]
+    db.session.add(user)
+    db.session.add_all(stickers)
+    db.session.commit()
+    return user, stickers
+
+
+def test_repeated_adds_share_one_cart_and_one_line(app, shopper):
+    user, (sticker, other) = shopper
+
+    assert add_item_to_cart(user.id, sticker.id, sticker.price) == 1
+    assert add_item_to_cart(user.id, sticker.id, sticker.price, 2) == 3
+    assert add_item_to_cart(user.id, other.id, other.price) == 4
+    db.session.commit()
+
+    cart = Order.query.filter_by(user_id=user.id, status="cart").one()
+    lines = {item.sticker_id: item.quantity for item in OrderItem.query.filter_by(order_id=cart.id)}
+    assert lines == {sticker.id: 3, other.id: 1}
+    assert cart.total_price == Decimal("3.46")
+
+
+def test_only_one_cart_per_user(app, shopper):
+    user, _ = shopper
+    cart_id = get_or_create_cart_id(user.id)
+    assert get_or_create_cart_id(user.id) == cart_id
+    db.session.commit()
+
+    # The partial unique index only covers carts: placed orders don't count
+    db.session.add(Order(user_id=user.id, created_at=utcnow(), status="pending", total_price=Decimal("0.00")))
+    db.session.commit()
+    db.session.add(Order(user_id=user.id, created_at=utcnow(), status="cart", total_price=Decimal("0.00")))
+    with pytest.raises(IntegrityError):
+        db.session.commit()
+    db.session.rollback()
+
+    # Once the cart is placed the next add starts a new one
+    Order.query.filter_by(id=cart_id).update({"status": "pending"})
+    assert get_or_create_cart_id(user.id) != cart_id
+
+
+def test_add_to_cart_endpoint(app, login, shopper):
+    user, (sticker, _) = shopper
+    client = login(app.test_client(), user)
+    headers = {"X-Requested-With": "XMLHttpRequest"}
+
+    client.post("/add_to_cart", data={"sticker_id": sticker.id}, headers=headers)
+    response = client.post("/add_to_cart", data={"sticker_id": sticker.id}, headers=headers)
+
+    assert response.get_json()["total_quantity"] == 2
+    assert OrderItem.query.count() == 1
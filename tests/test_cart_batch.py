@@ -0,0 +1,92 @@
+import pytest
+from models import Category, OrderItem, Sticker, User
+from extensions import db
+
+
+@pytest.fixture
+def stickers(app):
+    category_id = Category.query.first().id
+    stickers = [
+        Sticker(name=name, price=price, category_id=category_id, image_url="batch.webp", stock=10)
+        for name, price in (("Batch A", 1.00), ("Batch B", 0.50))
+    ]
+    db.session.add_all(stickers)
+    db.session.commit()
+    return [sticker.id for sticker in stickers]
+
+
+@pytest.fixture
+def user_client(app, login):
+    def user_client(name):
+        user = User(username=name, email=f"{name}@example.test")
+        user.set_password("password")
+        db.session.add(user)
+        db.session.commit()
+        return login(app.test_client(), user)
+    return user_client
+
+
+def batch(client, *operations):
+    response = client.post("/cart/batch", json={"operations": list(operations)})
+    return response.status_code, response.get_json()
+
+
+def test_applies_all_operations_in_one_go(user_client, stickers):
+    a, b = stickers
+    client = user_client("batcher")
+
+    status, state = batch(client, {"op": "add", "sticker_id": a, "quantity": 2}, {"op": "add", "sticker_id": b})
+    assert status == 200
+    assert state["total"] == "2.50"
+    item_a, item_b = (item["item_id"] for item in state["items"])
+
+    status, state = batch(
+        client,
+        {"op": "set", "item_id": item_a, "quantity": 5},
+        {"op": "remove", "item_id": item_b},
+    )
+    assert status == 200
+    assert [(item["sticker_id"], item["quantity"]) for item in state["items"]] == [(a, 5)]
+    assert state["total"] == "5.00"
+    assert state["total_quantity"] == 5
+
+
+def test_a_bad_operation_rolls_back_the_whole_batch(user_client, stickers):
+    a, b = stickers
+    client = user_client("batcher")
+    _, state = batch(client, {"op": "add", "sticker_id": a})
+    item_a = state["items"][0]["item_id"]
+
+    status, body = batch(
+        client,
+        {"op": "set", "item_id": item_a, "quantity": 3},
+        {"op": "add", "sticker_id": b},
+        {"op": "add", "sticker_id": 9999},
+    )
+
+    assert status == 400
+    assert body["success"] is False
+    assert [(item.sticker_id, item.quantity) for item in OrderItem.query.all()] == [(a, 1)]
+
+
+def test_cannot_touch_another_users_cart(user_client, stickers):
+    owner = user_client("owner")
+    _, state = batch(owner, {"op": "add", "sticker_id": stickers[0]})
+    item_id = state["items"][0]["item_id"]
+
+    intruder = user_client("intruder")
+    assert batch(intruder, {"op": "remove", "item_id": item_id})[0] == 400
+    assert batch(intruder, {"op": "add", "sticker_id": stickers[1]}, {"op": "set", "item_id": item_id, "quantity": 9})[0] == 400
+    assert db.session.get(OrderItem, item_id).quantity == 1
+
+
+@pytest.mark.parametrize("payload", [
+    {},
+    {"operations": "add"},
+    {"operations": [{"op": "explode"}]},
+    {"operations": [{"op": "add", "sticker_id": "1"}]},
+    {"operations": [{"op": "set", "item_id": 1, "quantity": -1}]},
+])
+def test_rejects_malformed_batches(user_client, stickers, payload):
+    client = user_client("batcher")
+    assert client.post("/cart/batch", json=payload).status_code == 400
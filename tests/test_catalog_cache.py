@@ -0,0 +1,36 @@
+from models import Category, Sticker
+from catalog_cache import bump_catalog_version, get_catalog
+from extensions import db
+
+
+def add_sticker(name):
+    sticker = Sticker(name=name, price=1.0, category_id=Category.query.first().id, image_url="cache.webp")
+    db.session.add(sticker)
+    bump_catalog_version()
+    db.session.flush()
+    return sticker.id
+
+
+def test_snapshot_is_dropped_when_the_change_commits(app):
+    before = get_catalog()
+    sticker_id = add_sticker("Fresh")
+
+    # Another request while the write is still open keeps serving the committed catalog
+    with app.app_context():
+        assert get_catalog() is before
+
+    db.session.commit()
+    after = get_catalog()
+    assert after.version == before.version + 1
+    assert after.get(sticker_id) is not None
+
+
+def test_rolled_back_change_keeps_the_snapshot(app):
+    before = get_catalog()
+    add_sticker("Never")
+    db.session.rollback()
+
+    assert get_catalog() is before
+    # The next commit is not mistaken for a catalog change
+    db.session.commit()
+    assert get_catalog() is before
@@ -0,0 +1,65 @@
+import pytest
+from models import Category, IdempotencyKey, InventoryMovement, Order, Payment, Sticker, User
+from cart import add_item_to_cart
+from inventory import on_hand_stock
+from extensions import db
+
+
+def make_user(name):
+    user = User(username=name, email=f"{name}@example.test")
+    user.set_password("password")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@pytest.fixture
+def cart(app):
+    # (user, order id, sticker id): a cart with 2 of a sticker that has 5 in stock
+    user = make_user("buyer")
+    sticker = Sticker(name="Checkout", price=1.5, category_id=Category.query.first().id, image_url="c.webp", stock=5)
+    db.session.add(sticker)
+    db.session.commit()
+    add_item_to_cart(user.id, sticker.id, sticker.price, 2)
+    db.session.commit()
+    order_id = db.session.query(Order.id).filter_by(user_id=user.id, status="cart").scalar()
+    return user, order_id, sticker.id
+
+
+def checkout_form(order_id, key):
+    return {
+        "order_id": order_id,
+        "idempotency_key": key,
+        "full_name": "Buyer",
+        "email": "buyer@example.test",
+        "payment_method": "cash",
+        "date": "2026-10-20",
+        "time": "12:00",
+    }
+
+
+def test_resubmitted_checkout_places_the_order_once(app, login, cart):
+    user, order_id, sticker_id = cart
+    client = login(app.test_client(), user)
+
+    first = client.post("/process_checkout", data=checkout_form(order_id, "a" * 32))
+    second = client.post("/process_checkout", data=checkout_form(order_id, "a" * 32))
+
+    assert first.status_code == second.status_code == 302
+    assert first.headers["Location"] == second.headers["Location"] == f"/checkout-success/{order_id}"
+    assert Payment.query.filter_by(order_id=order_id).count() == 1
+    # One decrement of 2, possibly spread over several shards
+    assert sum(m.delta for m in InventoryMovement.query.filter_by(order_id=order_id)) == -2
+    assert on_hand_stock([sticker_id])[sticker_id] == 3
+    assert db.session.get(Order, order_id).status == "pending"
+
+
+def test_checkout_of_someone_elses_order_stores_no_key(app, login, cart):
+    owner, order_id, sticker_id = cart
+    client = login(app.test_client(), make_user("other"))
+
+    assert client.post("/process_checkout", data=checkout_form(order_id, "b" * 32)).status_code == 404
+    assert client.post("/process_checkout", data=checkout_form(order_id, "b" * 32)).status_code == 404
+    assert client.get(f"/checkout-success/{order_id}").status_code == 404
+    assert IdempotencyKey.query.count() == 0
+    assert Payment.query.count() == 0
@@ -0,0 +1,93 @@
+import pytest
+from sqlalchemy import event
+from cart import add_item_to_cart
+from models import Category, Order, OrderItem, Sticker, User
+from utils import GUEST_CART_KEY
+from extensions import db
+
+
+@pytest.fixture
+def sticker_ids(app):
+    category_id = Category.query.first().id
+    stickers = [
+        Sticker(name=f"Guest {n}", price=1.00, category_id=category_id, image_url="guest.webp", stock=10)
+        for n in range(2)
+    ]
+    db.session.add_all(stickers)
+    db.session.commit()
+    return [sticker.id for sticker in stickers]
+
+
+@pytest.fixture
+def guest(app, sticker_ids):
+    # A browser that put 2 of the first sticker and 1 of the second in its cookie cart
+    client = app.test_client()
+    response = client.post("/cart/batch", json={"operations": [
+        {"op": "add", "sticker_id": sticker_ids[0], "quantity": 2},
+        {"op": "add", "sticker_id": sticker_ids[1]},
+    ]})
+    assert response.get_json()["total_quantity"] == 3
+    return client
+
+
+def cart_lines(user_id):
+    return {
+        sticker_id: quantity for sticker_id, quantity in
+        db.session.query(OrderItem.sticker_id, OrderItem.quantity).join(Order).filter(
+            Order.user_id == user_id, Order.status == "cart"
+        )
+    }
+
+
+def test_guest_carts_are_not_written_to_the_database(app, sticker_ids):
+    writes = []
+
+    def count_writes(conn, cursor, statement, parameters, context, executemany):
+        if not statement.lstrip().upper().startswith("SELECT"):
+            writes.append(statement)
+
+    client = app.test_client()
+    event.listen(db.engine, "before_cursor_execute", count_writes)
+    try:
+        client.post("/add_to_cart", data={"sticker_id": sticker_ids[0]})
+        client.post("/cart/batch", json={"operations": [{"op": "add", "sticker_id": sticker_ids[1]}]})
+        client.get("/cart")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count_writes)
+
+    assert writes == []
+    with client.session_transaction() as session:
+        assert session[GUEST_CART_KEY] == {str(sticker_ids[0]): 1, str(sticker_ids[1]): 1}
+
+
+def test_login_merges_into_the_existing_cart(app, guest, sticker_ids):
+    user = User(username="returning", email="returning@example.test")
+    user.set_password("password")
+    db.session.add(user)
+    db.session.flush()
+    add_item_to_cart(user.id, sticker_ids[0], 1.00, 1)
+    db.session.commit()
+
+    guest.post("/auth/login", data={"email": "returning@example.test", "password": "password"})
+
+    assert cart_lines(user.id) == {sticker_ids[0]: 3, sticker_ids[1]: 1}
+    assert Order.query.filter_by(user_id=user.id, status="cart").one().total_price == 4
+    with guest.session_transaction() as session:
+        assert GUEST_CART_KEY not in session
+
+
+def test_signup_takes_the_guest_cart_along(app, guest, sticker_ids):
+    guest.post("/auth/signup", data={
+        "username": "newcomer", "email": "new@example.test", "password": "pw", "passwordconfirm": "pw",
+    })
+
+    user = User.query.filter_by(username="newcomer").one()
+    assert cart_lines(user.id) == {sticker_ids[0]: 2, sticker_ids[1]: 1}
+
+
+def test_failed_login_keeps_the_guest_cart(app, guest):
+    guest.post("/auth/login", data={"email": "nobody@example.test", "password": "wrong"})
+
+    assert Order.query.count() == 0
+    with guest.session_transaction() as session:
+        assert len(session[GUEST_CART_KEY]) == 2
@@ -0,0 +1,99 @@
+from decimal import Decimal
+import pytest
+from sqlalchemy import func
+from models import Category, InventoryMovement, Order, StockShard, Sticker, User, utcnow
+from inventory import STOCK_SHARDS, decrement_stock, ensure_shards, on_hand_stock, reserve_stock
+from extensions import db
+
+STOCK = 20
+
+
+@pytest.fixture
+def sticker(app):
+    sticker = Sticker(
+        name="Sharded", price=1.0, category_id=Category.query.first().id, image_url="sharded.webp", stock=STOCK
+    )
+    db.session.add(sticker)
+    db.session.flush()
+    ensure_shards([sticker.id])
+    db.session.commit()
+    return sticker
+
+
+@pytest.fixture
+def new_order(app):
+    user = User(username="buyer", email="buyer@example.test")
+    user.set_password("password")
+    db.session.add(user)
+    db.session.commit()
+
+    def new_order():
+        order = Order(user_id=user.id, created_at=utcnow(), status="pending", total_price=Decimal("0.00"))
+        db.session.add(order)
+        db.session.commit()
+        return order.id
+    return new_order
+
+
+def shards(sticker_id):
+    return [
+        remaining for (remaining,) in
+        db.session.query(StockShard.remaining).filter_by(sticker_id=sticker_id).order_by(StockShard.shard)
+    ]
+
+
+def ledger_total(sticker_id):
+    return db.session.query(func.coalesce(func.sum(InventoryMovement.delta), 0)).filter_by(sticker_id=sticker_id).scalar()
+
+
+def assert_invariants(sticker_id):
+    # Shards never go negative, and the stock they hold is the starting stock plus the ledger
+    assert all(remaining >= 0 for remaining in shards(sticker_id))
+    assert sum(shards(sticker_id)) == STOCK + ledger_total(sticker_id)
+    assert on_hand_stock([sticker_id])[sticker_id] == sum(shards(sticker_id))
+
+
+def test_decrements_across_shards_keep_the_ledger_in_step(sticker, new_order):
+    # 1 and 2 fit in one shard; 5 is more than any shard of 20 / STOCK_SHARDS holds
+    for quantity in (1, 2, 5, 1, 3):
+        order_id = new_order()
+        assert decrement_stock({sticker.id: quantity}, order_id) == []
+        db.session.commit()
+        assert_invariants(sticker.id)
+
+    assert len(shards(sticker.id)) == STOCK_SHARDS
+    assert sum(shards(sticker.id)) == STOCK - 12
+    movements = InventoryMovement.query.filter_by(sticker_id=sticker.id).all()
+    assert {m.reason for m in movements} == {"checkout"}
+    assert all(m.delta < 0 and m.shard is not None for m in movements)
+
+
+def test_decrement_stops_at_zero(sticker, new_order):
+    assert decrement_stock({sticker.id: STOCK}, new_order()) == []
+    db.session.commit()
+
+    shortages = decrement_stock({sticker.id: 1}, new_order())
+    db.session.rollback()
+
+    assert [(s.sticker_id, s.available) for s in shortages] == [(sticker.id, 0)]
+    assert shards(sticker.id) == [0] * STOCK_SHARDS
+    assert_invariants(sticker.id)
+
+
+def test_decrement_leaves_other_orders_holds_alone(sticker, new_order):
+    holder = new_order()
+    assert reserve_stock(holder, {sticker.id: 15}) == []
+    db.session.commit()
+
+    shortages = decrement_stock({sticker.id: 6}, new_order())
+    db.session.rollback()
+    assert [(s.requested, s.available) for s in shortages] == [(6, 5)]
+    assert_invariants(sticker.id)
+
+    assert decrement_stock({sticker.id: 5}, new_order()) == []
+    db.session.commit()
+    # The holder can still check out everything it reserved
+    assert decrement_stock({sticker.id: 15}, holder) == []
+    db.session.commit()
+    assert sum(shards(sticker.id)) == 0
+    assert_invariants(sticker.id)
@@ -0,0 +1,57 @@
+from datetime import datetime, timedelta
+from decimal import Decimal
+import pytest
+from models import Order, User
+from pagination import decode_cursor, encode_cursor, paginate
+from extensions import db
+
+
+@pytest.fixture
+def order_ids(app):
+    # 7 orders, newest first; pairs share a created_at so the id has to break the tie
+    user = User(username="pager", email="pager@example.test")
+    user.set_password("password")
+    db.session.add(user)
+    db.session.flush()
+    start = datetime(2026, 1, 1)
+    orders = [
+        Order(user_id=user.id, created_at=start + timedelta(days=n // 2), status="finished", total_price=Decimal("1.00"))
+        for n in range(7)
+    ]
+    db.session.add_all(orders)
+    db.session.commit()
+    return [order.id for order in sorted(orders, key=lambda o: (o.created_at, o.id), reverse=True)]
+
+
+def newest_first(cursor=None):
+    return paginate(Order.query, [Order.created_at, Order.id], descending=True, cursor=cursor or "", per_page=3)
+
+
+def test_walks_forward_and_back(app, order_ids):
+    with app.test_request_context():
+        pages = [newest_first()]
+        while pages[-1].has_next:
+            pages.append(newest_first(pages[-1].next_cursor))
+
+        assert [[o.id for o in page] for page in pages] == [order_ids[0:3], order_ids[3:6], order_ids[6:]]
+        assert not pages[0].has_prev
+
+        back = [pages[-1]]
+        while back[-1].has_prev:
+            back.append(newest_first(back[-1].prev_cursor))
+
+        assert [[o.id for o in page] for page in back] == [order_ids[6:], order_ids[3:6], order_ids[0:3]]
+        assert not back[-1].has_prev
+        assert back[-1].has_next
+
+
+def test_broken_cursor_means_first_page(app, order_ids):
+    with app.test_request_context():
+        assert [o.id for o in newest_first("not-a-cursor")] == order_ids[:3]
+
+
+def test_cursor_round_trips_datetimes():
+    when = datetime(2026, 1, 2, 3, 4, 5)
+    cursor = encode_cursor([when, 7], "prev")
+
+    assert decode_cursor(cursor, [Order.created_at, Order.id]) == ([when, 7], "prev")
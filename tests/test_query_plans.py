@@ -0,0 +1,21 @@
+from fixtures import generate_synthetic
+from models import User
+from query_plans import check_query_plans
+from extensions import db
+
+# Big enough that order, order_item and payment are over MAX_ROWS, so a page that
+# loses its index (ix_order_user_status, ix_order_created_at...) scans them
+MAX_ROWS = 1000
+
+
+def test_main_pages_use_indexes(app):
+    generate_synthetic(users=100, stickers=200, orders=2000, batch_size=1000, seed=1)
+    admin = User(username="admin", email="admin@example.test", is_admin=True)
+    admin.set_password("password")
+    db.session.add(admin)
+    db.session.commit()
+
+    problems, checked = check_query_plans(app, MAX_ROWS)
+
+    assert checked > 0
+    assert [(route, table) for route, table, rows, statement in problems] == []
@@ -0,0 +1,70 @@
+from datetime import timedelta
+from decimal import Decimal
+import pytest
+from models import Category, Order, StockReservation, Sticker, User, utcnow
+from inventory import available_stock, reserve_stock
+from extensions import db
+
+
+@pytest.fixture
+def stock(app):
+    # (sticker id, [order ids]): 10 in stock and the carts of three users at checkout
+    users = [User(username=f"holder{n}", email=f"holder{n}@example.test", password="x") for n in range(3)]
+    sticker = Sticker(name="Held", price=1.0, category_id=Category.query.first().id, image_url="held.webp", stock=10)
+    db.session.add_all(users + [sticker])
+    db.session.flush()
+    orders = [
+        Order(user_id=user.id, created_at=utcnow(), status="cart", total_price=Decimal("0.00")) for user in users
+    ]
+    db.session.add_all(orders)
+    db.session.commit()
+    return sticker.id, [order.id for order in orders]
+
+
+def expire(order_id):
+    StockReservation.query.filter_by(order_id=order_id).update(
+        {"expires_at": utcnow() - timedelta(seconds=1)}, synchronize_session=False
+    )
+    db.session.commit()
+
+
+def test_holds_lower_availability_until_they_expire(stock):
+    sticker_id, (first, second, _) = stock
+    assert reserve_stock(first, {sticker_id: 6}) == []
+    db.session.commit()
+
+    assert available_stock([sticker_id]) == {sticker_id: 4}
+    # An order doesn't compete with its own hold
+    assert available_stock([sticker_id], exclude_order_id=first) == {sticker_id: 10}
+    shortages = reserve_stock(second, {sticker_id: 5})
+    db.session.rollback()
+    assert [(s.requested, s.available) for s in shortages] == [(5, 4)]
+
+    expire(first)
+    assert available_stock([sticker_id]) == {sticker_id: 10}
+    assert reserve_stock(second, {sticker_id: 5}) == []
+
+
+def test_reserving_again_replaces_the_orders_holds(stock):
+    sticker_id, (first, _, _) = stock
+    reserve_stock(first, {sticker_id: 6})
+    reserve_stock(first, {sticker_id: 2})
+    db.session.commit()
+
+    assert [h.quantity for h in StockReservation.query.filter_by(order_id=first)] == [2]
+    assert available_stock([sticker_id]) == {sticker_id: 8}
+
+
+def test_sweep_deletes_only_expired_holds(app, stock):
+    sticker_id, orders = stock
+    for order_id in orders:
+        reserve_stock(order_id, {sticker_id: 1})
+    db.session.commit()
+    expire(orders[0])
+    expire(orders[1])
+
+    result = app.test_cli_runner().invoke(args=["sweep-reservations"])
+
+    assert "Released 2 expired reservations" in result.output
+    assert [h.order_id for h in StockReservation.query.all()] == [orders[2]]
+    assert available_stock([sticker_id]) == {sticker_id: 9}
@@ -0,0 +1,68 @@
+import json
+import os
+import subprocess
+import sys
+import time
+import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Startup must stay cheap: gunicorn workers import app.py on boot, and every query
+# or slow step there is paid by each worker before it serves a request.
+MAX_STARTUP_SECONDS = float(os.getenv("MAX_STARTUP_SECONDS", 2))
+
+# Imports app.py in a fresh interpreter, so nothing was imported (or queried) before
+IMPORT_SCRIPT = """
+import json, time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+statements = []
+event.listen(Engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+started = time.perf_counter()
+import app
+print(json.dumps({"statements": statements, "seconds": time.perf_counter() - started}))
+"""
+
+
+@pytest.fixture
+def database_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("DATABASE_URL", f"sqlite:///{tmp_path / 'startup.db'}")
+    monkeypatch.setenv("FLASK_SECRET_KEY", "test")
+    return tmp_path / "startup.db"
+
+
+@pytest.fixture
+def statements():
+    captured = []
+
+    def count_statements(conn, cursor, statement, parameters, context, executemany):
+        captured.append(statement)
+
+    event.listen(Engine, "before_cursor_execute", count_statements)
+    yield captured
+    event.remove(Engine, "before_cursor_execute", count_statements)
+
+
+def test_import_runs_no_queries(database_env):
+    result = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    startup = json.loads(result.stdout.strip().splitlines()[-1])
+
+    assert startup["statements"] == []
+    assert startup["seconds"] < MAX_STARTUP_SECONDS
+    # Not even a connection: SQLite would have created the file
+    assert not database_env.exists()
+
+
+def test_create_app_runs_no_queries(database_env, statements):
+    from app import create_app
+    del statements[:]
+
+    started = time.perf_counter()
+    create_app()
+
+    assert statements == []
+    assert time.perf_counter() - started < MAX_STARTUP_SECONDS
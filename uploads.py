@@ -0,0 +1,210 @@
+import os
+import time
+import uuid
+from datetime import timedelta
+from flask import current_app
+from models import Sticker, CustomSticker, ImageUpload, StoredImage, utcnow
+from storage import get_storage
+from images import build_variants, file_sha256, perceptual_hash, hash_distance
+from utils import dialect_insert
+from catalog_cache import bump_catalog_version
+from extensions import db
+
+
+# Uploaded files wait here until the worker has stored them. Web and worker
+# processes must share this directory.
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR")
+UPLOAD_BATCH_SIZE = int(os.getenv("UPLOAD_BATCH_SIZE", 10))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("UPLOAD_MAX_ATTEMPTS", 5))
+UPLOAD_RETRY_BASE = 30
+
+TARGETS = {"sticker": Sticker, "custom_sticker": CustomSticker}
+
+
+def spool_dir():
+    path = UPLOAD_SPOOL_DIR or os.path.join(current_app.instance_path, "upload_spool")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _apply(target, stored, activate=False):
+    # Points a Sticker/CustomSticker at an image in the storage backend
+    target.image_url = stored.image_url
+    target.image_status = "ready"
+    if isinstance(target, Sticker):
+        if stored.image_variants is None:
+            # First time this image is used for a sticker (it was a custom request before)
+            stored.image_variants = build_variants(stored.image_url)
+        target.image_variants = stored.image_variants
+        if activate:
+            target.is_active = True
+    else:
+        target.image_sha256 = stored.sha256
+
+
+def enqueue_upload(file, target, activate=False):
+    # Saves the uploaded file to the spool directory and queues it for the worker.
+    # target is a Sticker or CustomSticker that has been flushed (has an id); it is
+    # marked as pending until the worker sets its image_url. A file that was stored
+    # before (same SHA-256) is reused right away without uploading. The caller commits.
+    ext = os.path.splitext(file.filename)[1].lower()
+    path = os.path.join(spool_dir(), f"{uuid.uuid4().hex}{ext}")
+    file.save(path)
+    sha256 = file_sha256(path)
+
+    stored = StoredImage.query.filter_by(sha256=sha256).first()
+    if stored is not None:
+        os.remove(path)
+        _apply(target, stored, activate)
+        if isinstance(target, Sticker):
+            bump_catalog_version()
+        return
+
+    target.image_status = "pending"
+    if isinstance(target, CustomSticker):
+        target.image_sha256 = sha256
+    kind = "sticker" if isinstance(target, Sticker) else "custom_sticker"
+    db.session.add(ImageUpload(
+        path=path,
+        filename=file.filename,
+        sha256=sha256,
+        target=kind,
+        target_id=target.id,
+        activate=activate,
+    ))
+
+
+def _register(sha256, path, image_url, image_variants):
+    # Adds the image to the registry; if another worker stored the same content
+    # meanwhile, theirs is kept
+    values = {
+        "sha256": sha256,
+        "phash": perceptual_hash(path),
+        "image_url": image_url,
+        "image_variants": image_variants,
+        "created_at": utcnow(),
+    }
+    stmt = dialect_insert(StoredImage)
+    if stmt is None:
+        db.session.add(StoredImage(**values))
+        db.session.flush()
+    else:
+        db.session.execute(stmt.values(values).on_conflict_do_nothing(index_elements=["sha256"]))
+    return StoredImage.query.filter_by(sha256=sha256).one()
+
+
+def _store(upload):
+    sha256 = upload.sha256 or file_sha256(upload.path)
+    stored = StoredImage.query.filter_by(sha256=sha256).first()
+    if stored is None:
+        with open(upload.path, "rb") as f:
+            image_url = get_storage().save(f, upload.filename)
+        target = db.session.get(TARGETS[upload.target], upload.target_id)
+        # Only shop stickers need resized variants
+        variants = build_variants(image_url, upload.path) if isinstance(target, Sticker) else None
+        stored = _register(sha256, upload.path, image_url, variants)
+
+    target = db.session.get(TARGETS[upload.target], upload.target_id)
+    if target is not None:
+        _apply(target, stored, upload.activate)
+    upload.status = "done"
+    upload.last_error = None
+    return upload.target == "sticker"
+
+
+def duplicate_requests(requests, max_distance=6):
+    # {request id: [(other request, "exact" | "similar")]} for custom sticker requests
+    # whose image matches another request's image, by SHA-256 or by perceptual hash
+    # within max_distance bits. Other requests are rows of (id, name, approval_status,
+    # image_sha256, phash), not full CustomSticker objects.
+    hashes = {r.id: r.image_sha256 for r in requests if r.image_sha256}
+    if not hashes:
+        return {}
+
+    columns = (
+        CustomSticker.id, CustomSticker.name, CustomSticker.approval_status, CustomSticker.image_sha256, StoredImage.phash
+    )
+    others = db.session.query(*columns).outerjoin(
+        StoredImage, StoredImage.sha256 == CustomSticker.image_sha256
+    ).filter(CustomSticker.image_sha256.in_(set(hashes.values()))).all()
+    phashes = {other.image_sha256: other.phash for other in others if other.phash}
+
+    # Similar images can have any SHA-256, so the perceptual hashes of all other
+    # requests are compared in memory; it is one narrow row per request
+    if phashes:
+        others += db.session.query(*columns).join(
+            StoredImage, StoredImage.sha256 == CustomSticker.image_sha256
+        ).filter(StoredImage.phash.isnot(None), CustomSticker.image_sha256.notin_(set(hashes.values()))).all()
+
+    duplicates = {}
+    for request_id, sha256 in hashes.items():
+        phash = phashes.get(sha256)
+        for other in others:
+            if other.id == request_id:
+                continue
+            if other.image_sha256 == sha256:
+                duplicates.setdefault(request_id, []).append((other, "exact"))
+            elif phash and other.phash and hash_distance(phash, other.phash) <= max_distance:
+                duplicates.setdefault(request_id, []).append((other, "similar"))
+    return duplicates
+
+
+def _failed(upload, error):
+    upload.attempts += 1
+    upload.last_error = str(error)[:1000]
+    if upload.attempts >= UPLOAD_MAX_ATTEMPTS:
+        upload.status = "failed"
+        target = db.session.get(TARGETS[upload.target], upload.target_id)
+        if target is not None:
+            target.image_status = "failed"
+    else:
+        upload.next_attempt_at = utcnow() + timedelta(seconds=UPLOAD_RETRY_BASE * 2 ** (upload.attempts - 1))
+
+
+def process_uploads(batch_size=UPLOAD_BATCH_SIZE):
+    # Stores one batch of spooled images and returns (done, failed). Each upload is
+    # committed on its own so one slow or broken file doesn't hold back the rest.
+    ids = [
+        upload_id for (upload_id,) in db.session.query(ImageUpload.id).filter(
+            ImageUpload.status == "pending",
+            ImageUpload.next_attempt_at <= utcnow()
+        ).order_by(ImageUpload.id).limit(batch_size)
+    ]
+    db.session.commit()
+
+    done = failed = 0
+    for upload_id in ids:
+        # SKIP LOCKED lets several workers share the queue
+        upload = ImageUpload.query.filter_by(id=upload_id, status="pending").with_for_update(skip_locked=True).first()
+        if upload is None:
+            db.session.rollback()
+            continue
+        try:
+            if _store(upload):
+                bump_catalog_version()
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            upload = db.session.get(ImageUpload, upload_id)
+            _failed(upload, e)
+            db.session.commit()
+            failed += 1
+            continue
+
+        done += 1
+        try:
+            os.remove(upload.path)
+        except OSError:
+            pass
+    return done, failed
+
+
+def run_upload_worker(interval=2, batch_size=UPLOAD_BATCH_SIZE):
+    while True:
+        done, failed = process_uploads(batch_size)
+        if done or failed:
+            print(f"Stored {done} images, {failed} failed")
+            continue
+        if not interval:
+            break
+        time.sleep(interval)
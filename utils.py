@@ -1,17 +1,32 @@
 from functools import wraps
-from flask import session, flash, redirect, url_for
-from models import User, Category
+from flask import g, session, flash, redirect, url_for
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from models import User, Category, Order, OrderItem
 from extensions import db
+from catalog_cache import get_catalog, bump_catalog_version
 
 
 UPLOAD_FOLDER = "static/images/stickers"
 ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "webp"}
 
+# Session key of the cookie cart used by visitors who are not logged in (see cart.py)
+GUEST_CART_KEY = "guest_cart"
+
 
 def allowed_file(filename):
     ext = filename.split(".")[-1].lower()
     return ext in ALLOWED_EXTENSIONS
 
+def dialect_insert(model):
+    # INSERT that supports ON CONFLICT (Postgres and SQLite), or None on other databases
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    return None
+
 def login_required(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
@@ -39,13 +54,44 @@ def admin_required(f):
 def create_default_categories():
     default_categories = ["Fontys", "Memes", "Games", "Custom Stickers", "Other"]
 
-    for name in default_categories:
-        exists = Category.query.filter_by(name=name).first()
-        if not exists:
-            db.session.add(Category(name=name))
+    existing = {name for (name,) in db.session.query(Category.name).filter(Category.name.in_(default_categories))}
+    missing = [name for name in default_categories if name not in existing]
+    for name in missing:
+        db.session.add(Category(name=name))
 
+    # Categories live in the catalog snapshot, so a change has to bump its version
+    if missing:
+        bump_catalog_version()
     db.session.commit()
 
 
+# Per-request values for the templates, each loaded at most once and kept on flask.g
+def current_user():
+    if 'current_user' not in g:
+        user_id = session.get('user_id')
+        g.current_user = db.session.get(User, user_id) if user_id else None
+    return g.current_user
+
+def navbar_categories():
+    if 'navbar_categories' not in g:
+        g.navbar_categories = list(get_catalog().categories.values())
+    return g.navbar_categories
+
+def cart_item_count(user_id):
+    return db.session.query(func.coalesce(func.sum(OrderItem.quantity), 0)).join(Order).filter(
+        Order.user_id == user_id,
+        Order.status == "cart"
+    ).scalar()
+
+def current_cart_item_count():
+    if 'cart_item_count' not in g:
+        user_id = session.get('user_id')
+        if user_id:
+            g.cart_item_count = cart_item_count(user_id)
+        else:
+            g.cart_item_count = sum(session.get(GUEST_CART_KEY, {}).values())
+    return g.cart_item_count
+
+
 
 